@@ -0,0 +1,451 @@
+import os
+import json
+import datetime as dt
+import numpy as np
+import pandas as pd
+from cache import fingerprint
+from profiling import PROFILER
+
+"""
+Created on Sat Oct 17 11:02:16 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+def get_aggregation(data : pd.DataFrame) -> pd.DataFrame:
+    with PROFILER.stage('aggregate', rows = len(data)) as record:
+        aggregate = data.groupby(by = ['customer_id'], as_index = False).agg(lastpurchasedate = ('order_date' , 'max'),
+                                                                             frequency = ('order_id', 'nunique'),
+                                                                             monetary = ('total_price', 'sum'))
+        
+        aggregate['recency'] = (data['order_date'].max() + dt.timedelta(1) - aggregate['lastpurchasedate']).dt.days
+        aggregate = aggregate[['customer_id', 'lastpurchasedate', 'recency', 'frequency', 'monetary']]
+        record['customers'] = len(aggregate)
+    return(aggregate)
+
+def order_key(orderid : pd.Series) -> np.ndarray:
+    # order_id is numeric after cleaning, so it can be kept as int64 instead of strings
+    return orderid.astype('int64').to_numpy()
+
+def pair_view(orders : np.ndarray) -> np.ndarray:
+    # (order, customer) rows seen as one 16 bytes value, for sorting and membership without a copy
+    return np.ascontiguousarray(orders).view('V16').ravel()
+
+class RFMState():
+
+    def __init__(self, **parameter):
+        # Running state per customer (aligned with self.customers) and the distinct
+        # (order, customer code) pairs seen so far, as a few runs sorted by pair_view
+        self.customers  = pd.Index(parameter.get('customers', []), dtype = 'object')
+        self.lastdate   = np.asarray(parameter.get('lastdate', np.full(len(self.customers), np.iinfo('int64').min)), dtype = 'int64')
+        self.monetary   = np.asarray(parameter.get('monetary', np.zeros(len(self.customers))), dtype = 'float64')
+        self.maxdate    = parameter.get('maxdate', np.iinfo('int64').min)
+
+        orders          = np.asarray(parameter.get('orders', np.empty((0, 2))), dtype = 'int64').reshape(-1, 2)
+        self.runs       = [np.unique(pair_view(orders))] if len(orders) else []
+        self.frequency  = np.bincount(self.orders[:, 1], minlength = len(self.customers))
+
+    def __codes(self, customers : np.ndarray) -> np.ndarray:
+        # Position of every customer in the state, new customers are appended
+        codes = self.customers.get_indexer(customers)
+        isnew = codes < 0
+        if(isnew.any()):
+            newcustomers   = pd.unique(customers[isnew])
+            self.customers = self.customers.append(pd.Index(newcustomers, dtype = 'object'))
+            self.lastdate  = np.concatenate([self.lastdate, np.full(len(newcustomers), np.iinfo('int64').min)])
+            self.monetary  = np.concatenate([self.monetary, np.zeros(len(newcustomers))])
+            self.frequency = np.concatenate([self.frequency, np.zeros(len(newcustomers), dtype = 'int64')])
+            codes[isnew]   = self.customers.get_indexer(customers[isnew])
+        return codes
+
+    def __add_orders(self, orderkey : np.ndarray, orderowner : np.ndarray):
+        # Keep only pairs not counted before, so frequency stays a distinct count. A chunk adds
+        # one sorted run, a run is merged into the previous one once it is at least half its
+        # size, so there are O(log n) runs to search and a chunk does not copy the whole history.
+        orders = np.unique(pair_view(np.column_stack([orderkey, orderowner])))
+        for run in self.runs:
+            position = np.minimum(np.searchsorted(run, orders), len(run) - 1)
+            orders   = orders[run[position] != orders]
+        if(len(orders) == 0):
+            return
+
+        self.frequency += np.bincount(orders.view('int64').reshape(-1, 2)[:, 1], minlength = len(self.customers))
+        self.runs.append(orders)
+        while(len(self.runs) > 1 and 2 * len(self.runs[-1]) >= len(self.runs[-2])):
+            run = self.runs.pop()
+            self.runs[-1] = np.insert(self.runs[-1], np.searchsorted(self.runs[-1], run), run)
+
+    @property
+    def orders(self) -> np.ndarray:
+        # Distinct (order, customer code) pairs of every run, sorted
+        if(len(self.runs) == 0):
+            return np.empty((0, 2), dtype = 'int64')
+        return np.sort(np.concatenate(self.runs)).view('int64').reshape(-1, 2)
+
+    def update(self, data : pd.DataFrame):
+        if(data.empty):
+            return self
+
+        codes = self.__codes(data['customer_id'].to_numpy(dtype = 'object'))
+        dates = data['order_date'].to_numpy(dtype = 'datetime64[ns]').view('int64')
+
+        # 1. Last purchase date
+        lastdate = pd.Series(dates).groupby(codes).max()
+        self.lastdate[lastdate.index] = np.maximum(self.lastdate[lastdate.index], lastdate.to_numpy())
+        self.maxdate = max(self.maxdate, int(dates.max()))
+
+        # 2. Monetary
+        self.monetary += np.bincount(codes, weights = data['total_price'].to_numpy(dtype = 'float64'),
+                                     minlength = len(self.customers))
+
+        # 3. Distinct order for frequency
+        self.__add_orders(order_key(data['order_id']), codes)
+        return self
+
+    def merge(self, other):
+        codes = self.__codes(other.customers.to_numpy(dtype = 'object'))
+
+        self.lastdate[codes] = np.maximum(self.lastdate[codes], other.lastdate)
+        self.monetary[codes] += other.monetary
+        self.maxdate = max(self.maxdate, other.maxdate)
+        self.__add_orders(other.orders[:, 0], codes[other.orders[:, 1]])
+        return self
+
+    def get_frequency(self) -> np.ndarray:
+        return self.frequency
+
+    def get_aggregation(self, referencedate = None) -> pd.DataFrame:
+        return build_aggregation(customers = self.customers,
+                                 lastdate = self.lastdate,
+                                 frequency = self.get_frequency(),
+                                 monetary = self.monetary,
+                                 maxdate = self.maxdate,
+                                 referencedate = referencedate)
+
+class RFMStateStore():
+
+    def __init__(self, path : str, **parameter):
+        # Per-customer arrays are flat binary files updated in place through a memory map,
+        # distinct (order, customer) pairs are append-only sorted segments. An update is first
+        # written to journal.npz (new values of the touched customers, new segment and meta),
+        # which is its commit point, then applied to the files; applying it twice is harmless.
+        self.path         = path
+        self.max_segments = parameter.get('max_segments', 8)
+        self.max_batches  = parameter.get('max_batches', 1000)
+        os.makedirs(self.path, exist_ok = True)
+        self.__recover()
+
+    def __file(self, name : str) -> str:
+        return os.path.join(self.path, name)
+
+    def __recover(self):
+        # Committed state : a pending journal is applied, anything written after the last
+        # commit (e.g. new customers of an interrupted update) is dropped
+        self.meta = self.__read_meta()
+        if(os.path.exists(self.__file('journal.npz'))):
+            self.__apply_journal()
+        self.__truncate()
+
+        with open(self.__file('customers.txt'), 'r', encoding = 'utf-8') as file:
+            content = file.read()
+        self.customers = pd.Index(content.split('\n')[:-1] if content else [], dtype = 'object')
+
+    def __read_meta(self) -> dict:
+        try:
+            with open(self.__file('meta.json'), 'r') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            meta = dict(n_customers = 0, maxdate = np.iinfo('int64').min, segments = [])
+        meta.setdefault('batches', [])
+        return meta
+
+    def __replace(self, name : str, write):
+        # write(file) into a temporary file, synced, then renamed over name
+        with open(self.__file(name + '.tmp'), 'wb') as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.__file(name + '.tmp'), self.__file(name))
+
+    def __write_meta(self):
+        self.__replace('meta.json', lambda file: file.write(json.dumps(self.meta).encode('utf-8')))
+
+    def __truncate(self):
+        size = self.meta['n_customers']
+        for name, itemsize in [('lastdate.bin', 8), ('monetary.bin', 8), ('frequency.bin', 8)]:
+            with open(self.__file(name), 'ab') as file:
+                file.truncate(size * itemsize)
+
+        with open(self.__file('customers.txt'), 'a+', encoding = 'utf-8') as file:
+            file.seek(0)
+            lines = file.read().split('\n')[:size]
+            file.seek(0)
+            file.truncate()
+            file.write(''.join(line + '\n' for line in lines))
+
+        # Segments left behind by an interrupted update or merge
+        for name in os.listdir(self.path):
+            if(name.startswith('orders_') and name not in self.meta['segments']):
+                os.remove(self.__file(name))
+
+    def __array(self, name : str, dtype : str, size : int = None) -> np.ndarray:
+        size = self.meta['n_customers'] if size is None else size
+        if(size == 0):
+            return np.empty(0, dtype = dtype)
+        return np.memmap(self.__file(name), dtype = dtype, mode = 'r+', shape = (size,))
+
+    def __segment(self, name : str) -> np.ndarray:
+        # Memory mapped, a binary search only reads the pages it visits
+        if(os.path.getsize(self.__file(name)) == 0):
+            return np.empty(0, dtype = 'V16')
+        return np.memmap(self.__file(name), dtype = 'V16', mode = 'r')
+
+    def __codes(self, customers : pd.Index) -> np.ndarray:
+        # New customers are appended to the files, they are committed with the meta
+        codes = self.customers.get_indexer(customers)
+        isnew = codes < 0
+        if(isnew.any()):
+            newcustomers = customers[isnew]
+            with open(self.__file('customers.txt'), 'a', encoding = 'utf-8') as file:
+                file.write(''.join(str(customer) + '\n' for customer in newcustomers))
+            for name, value in [('lastdate.bin', np.iinfo('int64').min), ('monetary.bin', 0.0), ('frequency.bin', 0)]:
+                with open(self.__file(name), 'ab') as file:
+                    np.full(len(newcustomers), value, dtype = 'float64' if name == 'monetary.bin' else 'int64').tofile(file)
+
+            codes[isnew] = np.arange(len(self.customers), len(self.customers) + len(newcustomers))
+            self.customers = self.customers.append(newcustomers)
+        return codes
+
+    def __new_orders(self, orders : np.ndarray) -> np.ndarray:
+        # Pairs already stored in any segment are dropped, lookup is a binary search per segment
+        orders = np.unique(pair_view(orders))
+        for name in self.meta['segments']:
+            segment = self.__segment(name)
+            if(len(segment)):
+                position = np.minimum(np.searchsorted(segment, orders), len(segment) - 1)
+                orders = orders[segment[position] != orders]
+        return orders
+
+    def __segment_name(self, offset : int = 1) -> str:
+        return 'orders_{:06d}.bin'.format(max([int(s[7:13]) for s in self.meta['segments']], default = -1) + offset)
+
+    def __commit(self, batch : RFMState, batchid : str):
+        # New absolute values of the touched customers, so the journal can be applied again
+        codes = self.__codes(batch.customers)
+        size  = len(self.customers)
+
+        orders = self.__new_orders(np.column_stack([batch.orders[:, 0], codes[batch.orders[:, 1]]]))
+        sorter = np.argsort(codes)
+        owner  = sorter[np.searchsorted(codes, orders.view('int64').reshape(-1, 2)[:, 1], sorter = sorter)]
+
+        meta = dict(self.meta,
+                    n_customers = size,
+                    maxdate = max(self.meta['maxdate'], batch.maxdate),
+                    segments = self.meta['segments'] + ([self.__segment_name()] if len(orders) else []),
+                    batches = (self.meta['batches'] + [batchid])[-self.max_batches:])
+
+        journal = dict(meta = np.array(json.dumps(meta)),
+                       codes = codes,
+                       lastdate = np.maximum(self.__array('lastdate.bin', 'int64', size)[codes], batch.lastdate),
+                       monetary = self.__array('monetary.bin', 'float64', size)[codes] + batch.monetary,
+                       frequency = self.__array('frequency.bin', 'int64', size)[codes] + np.bincount(owner, minlength = len(codes)),
+                       orders = orders.view('int64').reshape(-1, 2))
+        self.__replace('journal.npz', lambda file: np.savez(file, **journal))
+
+    def __apply_journal(self):
+        with np.load(self.__file('journal.npz')) as journal:
+            self.meta = json.loads(str(journal['meta']))
+            codes     = journal['codes']
+            for name, dtype in [('lastdate', 'int64'), ('monetary', 'float64'), ('frequency', 'int64')]:
+                array = self.__array(name + '.bin', dtype)
+                array[codes] = journal[name]
+                array.flush()
+                del array
+
+            orders = journal['orders']
+            if(len(orders)):
+                self.__replace(self.meta['segments'][-1], orders.tofile)
+
+        self.__write_meta()
+        os.remove(self.__file('journal.npz'))
+
+    def __merge_segments(self):
+        # Merge all segments into one when there are too many to search. The new segment
+        # replaces the others in the meta, the old files are removed after.
+        if(len(self.meta['segments']) <= self.max_segments):
+            return
+
+        name   = self.__segment_name()
+        merged = np.sort(np.concatenate([self.__segment(s) for s in self.meta['segments']]))
+        self.__replace(name, merged.tofile)
+        del merged
+
+        previous = self.meta['segments']
+        self.meta['segments'] = [name]
+        self.__write_meta()
+        for segment in previous:
+            os.remove(self.__file(segment))
+
+    def update(self, data : pd.DataFrame, batchid : str = None):
+        # Work is proportional to the batch : only touched customers and new pairs are read and
+        # written. A batch already applied (same batchid, by default a hash of its content, among
+        # the last max_batches) is skipped, so a batch can be sent again after a failed update.
+        batchid = batchid or fingerprint(data)
+        if(batchid in self.meta['batches']):
+            return self
+
+        batch = RFMState().update(data)
+        if(len(batch.customers) == 0):
+            return self
+
+        try:
+            self.__commit(batch, batchid)
+            self.__apply_journal()
+            self.__merge_segments()
+        except BaseException:
+            self.__recover()
+            raise
+        return self
+
+    def get_aggregation(self, referencedate = None) -> pd.DataFrame:
+        return build_aggregation(customers = self.customers,
+                                 lastdate = np.array(self.__array('lastdate.bin', 'int64')),
+                                 frequency = np.array(self.__array('frequency.bin', 'int64')),
+                                 monetary = np.array(self.__array('monetary.bin', 'float64')),
+                                 maxdate = self.meta['maxdate'],
+                                 referencedate = referencedate)
+
+def group_codes(column : pd.Series) -> tuple:
+    # Category code per row and sorted categories, missing value gets the extra last code
+    if(isinstance(column.dtype, pd.CategoricalDtype)):
+        codes, categories = column.cat.codes.to_numpy().astype('int64'), column.cat.categories
+    else:
+        codes, categories = pd.factorize(column, sort = True)
+    codes = np.where(codes < 0, len(categories), codes)
+    return codes, pd.Index(categories)
+
+def select_ranges(order : np.ndarray, offsets : np.ndarray, codes : np.ndarray) -> np.ndarray:
+    # Concatenated order[offsets[code]:offsets[code + 1]] of every code
+    if(len(codes) == 0):
+        return np.empty(0, dtype = order.dtype)
+    return np.concatenate([order[offsets[code]:offsets[code + 1]] for code in codes])
+
+class GroupIndex():
+
+    def __init__(self, data : pd.DataFrame, attributes : list = ['city', 'province', 'brand']):
+        # Per attribute : rows sorted by category code with offsets per code (rows of code c are
+        # order[offsets[c]:offsets[c + 1]]). Per (customer, combination of attribute codes) :
+        # partial last date, monetary and distinct order count, sorted by customer, so any filter
+        # is answered by merging the partials of the selected combinations.
+        self.attributes = [attribute for attribute in attributes if attribute in data.columns]
+        self.categories = {}
+        self.order      = {}
+        self.offsets    = {}
+
+        listcodes = []
+        for attribute in self.attributes:
+            codes, categories = group_codes(data[attribute])
+            self.categories[attribute] = categories
+            self.order[attribute]   = np.argsort(codes, kind = 'stable')
+            self.offsets[attribute] = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength = len(categories) + 1))])
+            listcodes.append(codes)
+
+        # 1. Combination of attribute codes present in the data
+        dims = [len(self.categories[attribute]) + 1 for attribute in self.attributes]
+        combination = np.ravel_multi_index(listcodes, dims) if listcodes else np.zeros(len(data), dtype = 'int64')
+        group, groupkey = pd.factorize(combination, sort = True)
+        self.groupcodes = np.column_stack(np.unravel_index(groupkey, dims)) if listcodes else np.zeros((1, 0), dtype = 'int64')
+
+        # 2. Partial aggregate per (customer, group), sorted by customer then group
+        customer, self.customers = pd.factorize(data['customer_id'], sort = True)
+        dates = data['order_date'].to_numpy(dtype = 'datetime64[ns]').view('int64')
+        key   = customer.astype('int64') * len(groupkey) + group
+        order = np.argsort(key, kind = 'stable')
+        key   = key[order]
+        start = np.flatnonzero(np.concatenate([[True], key[1:] != key[:-1]]))
+
+        self.partialcustomer = customer[order[start]]
+        self.partialgroup    = group[order[start]]
+        self.lastdate        = np.maximum.reduceat(dates[order], start)
+        self.monetary        = np.add.reduceat(data['total_price'].to_numpy(dtype = 'float64')[order], start)
+
+        # 3. Distinct (order, customer, group). When every order belongs to one group the
+        # frequency partials simply add up, otherwise the triples are kept for order level dedup
+        triples = np.column_stack([order_key(data['order_id']), customer, group]).astype('int64')
+        triples = np.unique(np.ascontiguousarray(triples).view('V24').ravel()).view('int64').reshape(-1, 3)
+        self.isorderlevel = len(np.unique(pair_view(triples[:, :2]))) == len(triples)
+
+        partialkey = self.partialcustomer.astype('int64') * len(groupkey) + self.partialgroup
+        self.frequency = np.bincount(np.searchsorted(partialkey, triples[:, 1] * len(groupkey) + triples[:, 2]),
+                                     minlength = len(partialkey))
+        self.triples = None if self.isorderlevel else triples
+
+    def __codes(self, attribute : str, values) -> np.ndarray:
+        if(attribute not in self.categories):
+            raise ValueError('No index on {}, indexed attributes : {}'.format(attribute, ', '.join(self.attributes)))
+        values = [values] if isinstance(values, str) or not np.iterable(values) else list(values)
+        codes  = self.categories[attribute].get_indexer(values)
+        return np.unique(codes[codes >= 0])
+
+    def rows(self, **filters) -> np.ndarray:
+        # Sorted row positions matching every filter (attribute = value or list of values)
+        rows = None
+        for attribute, values in filters.items():
+            selected = np.sort(select_ranges(self.order[attribute], self.offsets[attribute], self.__codes(attribute, values)))
+            rows = selected if rows is None else np.intersect1d(rows, selected, assume_unique = True)
+        return np.arange(self.offsets[self.attributes[0]][-1]) if rows is None else rows
+
+    def get_aggregation(self, referencedate = None, **filters) -> pd.DataFrame:
+        # Same result as get_aggregation on the filtered transactions, without rescanning them
+        isgroup = np.ones(len(self.groupcodes), dtype = bool)
+        for attribute, values in filters.items():
+            column   = self.attributes.index(attribute) if attribute in self.attributes else None
+            selected = self.__codes(attribute, values)
+            isgroup &= np.isin(self.groupcodes[:, column], selected)
+
+        isselected = isgroup[self.partialgroup]
+        customer   = self.partialcustomer[isselected]
+        if(len(customer) == 0):
+            return build_aggregation(customers = self.customers[:0], lastdate = np.empty(0, dtype = 'int64'),
+                                     frequency = np.empty(0, dtype = 'int64'), monetary = np.empty(0),
+                                     maxdate = 0, referencedate = referencedate)
+
+        # Partials are sorted by customer, merge every run of the same customer
+        start    = np.flatnonzero(np.concatenate([[True], customer[1:] != customer[:-1]]))
+        lastdate = np.maximum.reduceat(self.lastdate[isselected], start)
+        if(self.isorderlevel):
+            frequency = np.add.reduceat(self.frequency[isselected], start)
+        else:
+            triples   = self.triples[isgroup[self.triples[:, 2]]]
+            pairs     = np.unique(pair_view(triples[:, :2])).view('int64').reshape(-1, 2)
+            frequency = np.bincount(pairs[:, 1], minlength = len(self.customers))[customer[start]]
+
+        return build_aggregation(customers = self.customers[customer[start]],
+                                 lastdate = lastdate,
+                                 frequency = frequency,
+                                 monetary = np.add.reduceat(self.monetary[isselected], start),
+                                 maxdate = int(lastdate.max()),
+                                 referencedate = referencedate)
+
+def build_aggregation(**parameter) -> pd.DataFrame:
+    # Recency is counted to referencedate, by default one day after the latest order
+    referencedate = parameter.get('referencedate')
+    if(referencedate is None):
+        referencedate = pd.Timestamp(parameter.get('maxdate')) + pd.Timedelta(days = 1)
+
+    aggregate = pd.DataFrame(dict(customer_id = parameter.get('customers'),
+                                  lastpurchasedate = pd.to_datetime(parameter.get('lastdate'))))
+    aggregate['recency']   = (pd.Timestamp(referencedate) - aggregate['lastpurchasedate']).dt.days
+    aggregate['frequency'] = parameter.get('frequency')
+    aggregate['monetary']  = parameter.get('monetary')
+
+    aggregate = aggregate.sort_values(by = ['customer_id'], ignore_index = True)
+    return aggregate
+
+def get_aggregation_stream(chunks, **parameter) -> pd.DataFrame:
+    # chunks is any iterable of cleaned transaction frames, e.g. DataSource.iter_data()
+    state = RFMState()
+    for data in chunks:
+        state.update(data[['order_id', 'customer_id', 'order_date', 'total_price']])
+
+    return state.get_aggregation(referencedate = parameter.get('referencedate'))
@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import numpy as np
+import pandas as pd
+import data_and_attributes as da
+import modelling as model
+from aggregation import get_aggregation
+from profiling import RSSPEAK, release_memory
+
+"""
+Created on Sat Oct 17 17:25:41 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+def product_price(n_customers : int, seed : int = 42) -> np.ndarray:
+    # One price list per run, shared by every chunk
+    random = np.random.default_rng(seed)
+    return np.round(random.lognormal(11, 0.8, max(50, n_customers // 20)), -2)
+
+def generate_transactions(**parameter) -> pd.DataFrame:
+    # Synthetic line items with the DataSource.columntype schema plus order_date for the customers
+    # first_customer .. first_customer + n_customers, order ids start at first_order.
+    # skew is the sigma of a lognormal number of orders per customer (0 = every customer equal).
+    random             = np.random.default_rng(parameter.get('seed', 42))
+    n_customers        = parameter.get('n_customers', 10000)
+    first_customer     = parameter.get('first_customer', 0)
+    first_order        = parameter.get('first_order', 0)
+    orders_per_customer = parameter.get('orders_per_customer', 5)
+    items_per_order    = parameter.get('items_per_order', 2)
+    skew               = parameter.get('skew', 1.0)
+    days               = parameter.get('days', 365)
+    startdate          = pd.Timestamp(parameter.get('startdate', '2019-01-01'))
+    productprice       = parameter.get('price')
+    if(productprice is None):
+        productprice = product_price(n_customers, parameter.get('seed', 42))
+
+    # 1. Orders per customer
+    weight = random.lognormal(0, skew, n_customers) if skew > 0 else np.ones(n_customers)
+    n_orders = n_customers * orders_per_customer
+    ordercustomer = first_customer + random.choice(n_customers, n_orders, p = weight / weight.sum())
+    orderdate = random.integers(0, days, n_orders)
+
+    # 2. Line items per order
+    n_items = random.poisson(items_per_order - 1, n_orders) + 1
+    itemorder = np.repeat(np.arange(n_orders), n_items)
+    n_rows = len(itemorder)
+
+    product  = random.integers(0, len(productprice), n_rows)
+    quantity = random.integers(1, 6, n_rows).astype('float64')
+    price    = productprice[product]
+
+    cities = np.array(['City {}'.format(index) for index in range(60)])
+    city   = random.integers(0, len(cities), n_orders)[itemorder]
+
+    return pd.DataFrame(dict(order_id = (1_000_000 + first_order + itemorder).astype(str),
+                             order_date = startdate + pd.to_timedelta(orderdate[itemorder], unit = 'D'),
+                             customer_id = (10_000 + ordercustomer[itemorder]).astype(str),
+                             city = cities[city],
+                             province = np.char.add('Province ', (city % 20).astype(str)),
+                             product_id = np.char.add('P', product.astype(str)),
+                             brand = np.char.add('BRAND_', (product % 40).astype(str)),
+                             quantity = quantity,
+                             item_price = price,
+                             total_price = quantity * price))
+
+def write_sources(path : str, n_customers : int, n_files : int = 4, chunk_customers : int = 20_000, **parameter) -> tuple:
+    # Every file holds a customer range, generated and appended chunk by chunk with a seed per
+    # chunk, so memory stays at one chunk whatever the number of rows. Returns the paths and rows.
+    seed  = parameter.pop('seed', 42)
+    price = product_price(n_customers, seed)
+    orders_per_customer = parameter.get('orders_per_customer', 5)
+
+    listsource, chunk, n_rows = [], 0, 0
+    bound = np.linspace(0, n_customers, n_files + 1).astype('int64')
+    for index in range(n_files):
+        filename = os.path.join(path, 'retail_{:03d}.csv'.format(index))
+        for first in range(bound[index], max(bound[index + 1], bound[index] + 1), chunk_customers):
+            size = min(chunk_customers, bound[index + 1] - first)
+            part = generate_transactions(n_customers = size,
+                                         first_customer = first,
+                                         first_order = first * orders_per_customer,
+                                         price = price,
+                                         seed = [seed, chunk],
+                                         **parameter)
+            part.to_csv(filename, mode = 'w' if first == bound[index] else 'a',
+                        header = first == bound[index], index = False)
+            n_rows += len(part)
+            chunk  += 1
+            del part
+        listsource.append(filename)
+    return listsource, n_rows
+
+def measure(stage : str, function, result : dict):
+    # Wall time, CPU time and peak resident memory above the start of the stage (sampled RSS,
+    # so Arrow buffers count and timings are not slowed down by allocation tracing)
+    release_memory()
+    token = RSSPEAK.start()
+    walltime, cputime = time.perf_counter(), time.process_time()
+    value = function()
+    walltime, cputime = time.perf_counter() - walltime, time.process_time() - cputime
+    peak, start = RSSPEAK.stop(token)
+
+    result[stage] = dict(wall_time = round(walltime, 4),
+                         cpu_time = round(cputime, 4),
+                         peak_memory_mb = round((peak - start) / 1024 ** 2, 2))
+    return value
+
+def run_benchmark(rows : int, **parameter) -> dict:
+    orders_per_customer = parameter.get('orders_per_customer', 5)
+    items_per_order     = parameter.get('items_per_order', 2)
+    n_customers = max(10, rows // (orders_per_customer * items_per_order))
+
+    with tempfile.TemporaryDirectory() as path:
+        listsource, n_rows = write_sources(path, n_customers,
+                                           n_files = parameter.get('n_files', 4),
+                                           orders_per_customer = orders_per_customer,
+                                           items_per_order = items_per_order,
+                                           skew = parameter.get('skew', 1.0),
+                                           days = parameter.get('days', 365),
+                                           seed = parameter.get('seed', 42))
+        result = dict(rows = n_rows, customers = n_customers)
+
+        datasource = da.DataSource(listsource = listsource, usecache = False)
+        data = measure('ingest', datasource.read_data, result)
+
+    data = measure('clean', lambda: da.clean_data(data), result)
+    rfm_per_cust = measure('aggregation', lambda: get_aggregation(data[['order_id', 'customer_id', 'order_date', 'total_price']]), result)
+    del data
+
+    modelrfm = model.Modelling(data = rfm_per_cust[['recency', 'frequency', 'monetary']], usecache = False)
+    scaled = measure('standarization', lambda: modelrfm.standarization(scalertype = parameter.get('scalertype', 'Standard Scaler')), result)
+
+    # Clustering alone, on the matrix scaled above
+    modelrfm = model.Modelling(data = pd.DataFrame(scaled, columns = ['recency', 'frequency', 'monetary'], copy = False), usecache = False)
+    measure('clustering', lambda: modelrfm.clustering(clustertype = parameter.get('engine', 'kmeans'),
+                                                      set_params = dict(standarization = False,
+                                                                        n_clusters = parameter.get('n_clusters', 5))), result)
+    result['clustering'].update(n_iter = modelrfm.fitreport['n_iter'])
+    return result
+
+def compare(current : dict, baseline : dict, threshold : float = 1.2) -> list:
+    # Stage whose wall time or peak memory grew more than threshold times the baseline
+    baselinerun = {run['rows'] : run for run in baseline['runs']}
+    regression  = []
+    for run in current['runs']:
+        previous = baselinerun.get(run['rows'])
+        if(previous is None):
+            continue
+        for stage, value in run.items():
+            if(not isinstance(value, dict) or stage not in previous):
+                continue
+            for metric in ['wall_time', 'peak_memory_mb']:
+                ratio = value[metric] / max(previous[stage][metric], 1e-9)
+                if(ratio > threshold):
+                    regression.append(dict(rows = run['rows'], stage = stage, metric = metric, ratio = round(ratio, 2)))
+    return regression
+
+def main(argv : list = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark RFM pipeline stages on synthetic transactions')
+    parser.add_argument('--rows', type = float, nargs = '+', default = [1e4, 1e5, 1e6], help = 'Line items per run, up to 1e8')
+    parser.add_argument('--orders-per-customer', type = int, default = 5)
+    parser.add_argument('--items-per-order', type = int, default = 2)
+    parser.add_argument('--skew', type = float, default = 1.0)
+    parser.add_argument('--days', type = int, default = 365)
+    parser.add_argument('--engine', default = 'kmeans')
+    parser.add_argument('--output', default = 'benchmark.json')
+    parser.add_argument('--baseline', help = 'Earlier benchmark JSON to compare against')
+    args = parser.parse_args(argv)
+
+    report = dict(python = sys.version.split()[0],
+                  platform = platform.platform(),
+                  pandas = pd.__version__,
+                  numpy = np.__version__,
+                  parameter = vars(args),
+                  runs = [])
+
+    # Lazy sklearn import outside the measured stages
+    model.sklearn_preprocessing(), model.sklearn_cluster()
+    for rows in args.rows:
+        run = run_benchmark(int(rows),
+                            orders_per_customer = args.orders_per_customer,
+                            items_per_order = args.items_per_order,
+                            skew = args.skew,
+                            days = args.days,
+                            engine = args.engine)
+        report['runs'].append(run)
+        print(json.dumps(run), file = sys.stderr)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent = 2)
+
+    if(args.baseline):
+        with open(args.baseline, 'r') as file:
+            regression = compare(report, json.load(file))
+        print(json.dumps(dict(regression = regression), indent = 2))
+        if(regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import sys
+import time
+import hashlib
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+"""
+Created on Sat Oct 17 10:05:48 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+logger = logging.getLogger('rfm_analysis.cache')
+
+def sizeof(value) -> int:
+    if(isinstance(value, (pd.DataFrame, pd.Series))):
+        usage = value.memory_usage(index = True, deep = True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if(isinstance(value, np.ndarray)):
+        return int(value.nbytes)
+    if(isinstance(value, (tuple, list))):
+        return sum(map(sizeof, value))
+    if(isinstance(value, dict)):
+        return sum(map(sizeof, value.values()))
+    return sys.getsizeof(value)
+
+def fingerprint(value) -> str:
+    # Content hash of a frame or array, used as cache key instead of hashing on every lookup
+    digest = hashlib.sha1()
+    if(isinstance(value, (pd.DataFrame, pd.Series))):
+        digest.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(value, index = False).to_numpy().tobytes())
+    else:
+        value = np.ascontiguousarray(value)
+        digest.update(repr((value.dtype.str, value.shape)).encode('utf-8'))
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+class KeyedCache():
+
+    def __init__(self, **parameter):
+        # Entry expire after ttl seconds (None = never), least recently used entry
+        # is evicted when max_entries or max_bytes is exceeded, on_evict(key, value)
+        # is called for every entry removed that way (e.g. to delete a file)
+        self.ttl         = parameter.get('ttl')
+        self.max_entries = parameter.get('max_entries', 32)
+        self.max_bytes   = parameter.get('max_bytes')
+        self.sizeof      = parameter.get('sizeof', sizeof)
+        self.on_evict    = parameter.get('on_evict')
+
+        self.__entries = OrderedDict()
+        self.__nbytes  = 0
+        self.__lock    = threading.RLock()
+        self.__keylock = {}
+
+    def __expired(self, created : float) -> bool:
+        return self.ttl is not None and time.monotonic() - created > self.ttl
+
+    def __evict(self):
+        # The newest entry is always kept, even alone above max_bytes, otherwise a value larger
+        # than the cache would be computed again on every lookup
+        while(len(self.__entries) > 1 and (len(self.__entries) > self.max_entries or
+                                           (self.max_bytes is not None and self.__nbytes > self.max_bytes))):
+            key, (value, size, created) = self.__entries.popitem(last = False)
+            self.__nbytes -= size
+            if(self.on_evict is not None):
+                self.on_evict(key, value)
+
+        if(self.max_bytes is not None and self.__nbytes > self.max_bytes):
+            logger.warning('Cache entry of {:,} bytes is larger than max_bytes ({:,}), kept as the only entry'
+                           .format(self.__nbytes, self.max_bytes))
+
+    def get(self, key, default = None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if(entry is None):
+                return default
+
+            value, size, created = entry
+            if(self.__expired(created)):
+                self.pop(key)
+                return default
+
+            self.__entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self.__lock:
+            self.pop(key)
+            self.__entries[key] = (value, size, time.monotonic())
+            self.__nbytes += size
+            self.__evict()
+
+    def pop(self, key, default = None):
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if(entry is None):
+                return default
+
+            self.__nbytes -= entry[1]
+            return entry[0]
+
+    def get_or_compute(self, key, function):
+        missing = object()
+        value = self.get(key, missing)
+        if(value is not missing):
+            return value
+
+        # Only one caller computes a given key, concurrent callers wait for its result
+        with self.__lock:
+            keylock = self.__keylock.setdefault(key, threading.Lock())
+
+        with keylock:
+            value = self.get(key, missing)
+            if(value is missing):
+                value = function()
+                self.set(key, value)
+
+        with self.__lock:
+            self.__keylock.pop(key, None)
+
+        return value
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__nbytes = 0
+
+    def __contains__(self, key) -> bool:
+        missing = object()
+        return self.get(key, missing) is not missing
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def nbytes(self) -> int:
+        return self.__nbytes
@@ -1,5 +1,17 @@
+import glob
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from source_cache import SourceCache
+from cache import KeyedCache, fingerprint
+from profiling import PROFILER
+from aggregation import GroupIndex
+
+try:
+    import pyarrow
+    STRINGTYPE = 'string[pyarrow]'
+except ImportError:
+    STRINGTYPE = 'string'
 
 """
 Created on Wed May 25 21:14:20 2022
@@ -7,67 +19,190 @@ Created on Wed May 25 21:14:20 2022
 @author: Bachtiyar M. Arief
 """
 
+# Cleaned data shared by every DataSource (and every Streamlit session) in the process
+DATACACHE = KeyedCache(ttl = 6 * 3600,
+                       max_entries = 4,
+                       max_bytes = 4 * 1024 ** 3)
+
 class DataSource():
     
-    def __init__(self):
+    def __init__(self, **parameter):
         # List of data source 
         filesource = ['10%_original_randomstate=42/retail_data_from_1_until_3_reduce.csv', 
                       '10%_original_randomstate=42/retail_data_from_4_until_6_reduce.csv',
                       '10%_original_randomstate=42/retail_data_from_7_until_9_reduce.csv',
                       '10%_original_randomstate=42/retail_data_from_10_until_12_reduce.csv']
         
-        self.listsource = list(map(lambda ls: 'https://dataset.dqlab.id/' + ls, filesource))
+        defaultsource = list(map(lambda ls: 'https://dataset.dqlab.id/' + ls, filesource))
         
+        # Source can be URL, local path or glob pattern (e.g. 'data/retail_*.csv')
+        self.listsource = expand_source(parameter.get('listsource', defaultsource))
+        
+        # Identifier as Arrow-backed string, low cardinality attribute as category
         self.columntype = dict(
-                order_id    = 'object',
-                customer_id = 'object',
-                city        = 'object',
-                province    = 'object',
-                product_id  = 'object',
-                brand       = 'object',
+                order_id    = STRINGTYPE,
+                customer_id = STRINGTYPE,
+                city        = 'category',
+                province    = 'category',
+                product_id  = 'category',
+                brand       = 'category',
                 quantity    = 'double',
                 item_price  = 'double',
                 total_price = 'double'
                 )
         
-        self.__getdata = self.get_data()
+        # Local columnar copy of every source, set usecache = False to always download
+        self.cache = SourceCache(cachedir = parameter.get('cachedir'),
+                                 columntype = self.columntype,
+                                 parse_dates = ['order_date'])
+        self.usecache = parameter.get('usecache', True)
+        
+        # Sources are fetched and parsed concurrently, executor is 'thread' or 'process'
+        self.workers  = parameter.get('workers', min(8, len(self.listsource)))
+        self.executor = parameter.get('executor', 'thread')
+        
+        # Set memoryreport = True to record memory usage after every cleaning stage
+        self.memoryreport = [] if parameter.get('memoryreport', False) else None
+        
+        # Data is read and cleaned lazily on the first get_data / get_attribute call
+        self.datakey = (tuple(self.listsource), tuple(sorted(self.columntype.items())))
 
     def __read_data(self) -> pd.DataFrame:
         
-        for index in range(len(self.listsource)):
-            data = pd.read_csv(self.listsource[index], 
-                               dtype = self.columntype,
-                               parse_dates = ['order_date'])
-            
-            if(index == 0):
-                dataintegration = data
-            else:
-                dataintegration = pd.concat([dataintegration, data[dataintegration.columns]], ignore_index = True)
-               
-        return dataintegration
-    
-    def get_data(self) -> pd.DataFrame:
+        if(not self.listsource):
+            raise ValueError('DataSource needs at least one source')
         
-        # Get data integration
-        data = self.__read_data().copy()
+        readparams = dict(cache = self.cache if self.usecache else None,
+                          columntype = self.columntype)
         
-        # 1. Drop if any null value in order_id or customer_id
-        data = data.dropna(subset = ['order_id', 'customer_id'], how = 'any')
+        if(self.workers > 1 and len(self.listsource) > 1):
+            poolexecutor = ProcessPoolExecutor if self.executor == 'process' else ThreadPoolExecutor
+            with poolexecutor(max_workers = self.workers) as pool:
+                futures = [pool.submit(read_source, source, **readparams) for source in self.listsource]
+                listdata = [future.result() for future in futures]
+        else:
+            listdata = [read_source(source, **readparams) for source in self.listsource]
         
-        # 2. Make sure that order_id is numeric format only
-        # 3. Drop row which containing empty string, 0 or NaN value in customer_id column
-        data = data.loc[(data['order_id'].str.isnumeric()) & (~data['customer_id'].isin(['', '0']))]
+        # Every source must provide the typed columns, then it is integrated with a single concat
+        columns = listdata[0].columns
+        for source, data in zip(self.listsource, listdata):
+            missing = sorted(set(columns).union(self.columntype, ['order_date']).difference(data.columns))
+            if(missing):
+                raise ValueError('Source {} is missing column(s) : {}'.format(source, ', '.join(missing)))
         
-        # 4. Total price must be positive value
-        data['total_price'] = data['total_price'].abs()
-            
-        # 5. Reset index
-        data = data.reset_index(drop = True)
+        # Categories differ per source, align them so concat keeps the category dtype
+        for column in columns:
+            if(self.columntype.get(column) == 'category' and len(listdata) > 1):
+                categories = pd.api.types.union_categoricals([data[column] for data in listdata],
+                                                             sort_categories = True).categories
+                for data in listdata:
+                    data[column] = data[column].cat.set_categories(categories)
         
+        dataintegration = pd.concat([data[columns] for data in listdata], ignore_index = True)
+        return dataintegration
+    
+    def __clean_data(self) -> pd.DataFrame:
+        
+        # Get data integration
+        with PROFILER.stage('read', sources = len(self.listsource)) as record:
+            data = self.__read_data()
+            record['rows'] = len(data)
+        
+        with PROFILER.stage('clean') as record:
+            data = clean_data(data, report = self.memoryreport)
+            record['rows'] = len(data)
         return data
+    
+    def read_data(self) -> pd.DataFrame:
+        # Integrated raw data, not cleaned and not cached
+        return self.__read_data()
+    
+    def get_data(self) -> pd.DataFrame:
+        # Cleaned frame is shared between callers, do not modify it in place
+        return DATACACHE.get_or_compute(('data',) + self.datakey, self.__clean_data)
         
     def get_attribute(self, columns : str) -> list:
-        return sorted(self.__getdata[columns].unique().tolist())
+        return DATACACHE.get_or_compute(('attribute', columns) + self.datakey,
+                                        lambda: sorted(self.get_data()[columns].unique().tolist()))
+    
+    def get_fingerprint(self) -> str:
+        # Content hash of the cleaned data, computed once per dataset to key models and exports
+        return DATACACHE.get_or_compute(('fingerprint',) + self.datakey, lambda: fingerprint(self.get_data()))
+    
+    def get_groupindex(self, attributes : tuple = ('city', 'province', 'brand')) -> GroupIndex:
+        # Row offsets and partial R-F-M per attribute combination, built once per dataset
+        return DATACACHE.get_or_compute(('groupindex', tuple(attributes)) + self.datakey,
+                                        lambda: GroupIndex(self.get_data(), attributes = list(attributes)))
+    
+    def iter_data(self, chunksize : int = 1_000_000):
+        # Cleaned chunks read straight from the sources, nothing is kept in memory
+        for source in self.listsource:
+            reader = pd.read_csv(source, 
+                                 dtype = self.columntype,
+                                 parse_dates = ['order_date'],
+                                 chunksize = chunksize)
+            with reader:
+                for data in reader:
+                    yield clean_data(data)
+    
+    def refresh(self):
+        # Drop the cleaned data and attribute indexes, next call re-reads the sources
+        for key in [('data',), ('fingerprint',), ('groupindex', ('city', 'province', 'brand'))] + [('attribute', columns) for columns in self.columntype]:
+            DATACACHE.pop(key + self.datakey)
+
+def memory_usage(data : pd.DataFrame) -> float:
+    return data.memory_usage(index = True, deep = True).sum() / 1024 ** 2
+
+def clean_data(data : pd.DataFrame, report : list = None) -> pd.DataFrame:
+    
+    def add_report(stage : str):
+        if(report is not None):
+            report.append(dict(stage = stage, rows = len(data), memory_mb = round(float(memory_usage(data)), 2)))
+    
+    add_report('read')
+    
+    # 1. Drop if any null value in order_id or customer_id
+    # 2. Make sure that order_id is numeric format only
+    # 3. Drop row which containing empty string, 0 or NaN value in customer_id column
+    orderid    = data['order_id'].astype(STRINGTYPE)
+    customerid = data['customer_id']
+    isvalid    = orderid.str.isnumeric().fillna(False) & customerid.notna() & ~customerid.isin(['', '0'])
+    
+    # 4. Reset index, boolean selection already returns a new frame so no copy is needed
+    data = data.loc[isvalid.to_numpy(dtype = bool)].reset_index(drop = True)
+    add_report('filter')
+    
+    # 5. order_id as integer key, only valid rows are parsed
+    data['order_id'] = orderid[isvalid].astype('int64').to_numpy()
+    
+    # 6. Total price must be positive value
+    data['total_price'] = data['total_price'].abs()
+    add_report('typed')
+    
+    return data
+
+def expand_source(listsource : list) -> list:
+    expanded = []
+    for source in listsource:
+        if('://' in source or not any(char in source for char in '*?[')):
+            expanded.append(source)
+            continue
+        
+        matches = sorted(glob.glob(source))
+        if(not matches):
+            raise FileNotFoundError('No source file matches {}'.format(source))
+        expanded.extend(matches)
+    
+    return expanded
+
+def read_source(source : str, **parameter) -> pd.DataFrame:
+    cache = parameter.get('cache')
+    if(cache is not None):
+        return cache.read(source)
+    
+    return pd.read_csv(source, 
+                       dtype = parameter.get('columntype'),
+                       parse_dates = ['order_date'])
 
 class Formater():
     
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+from cache import KeyedCache, fingerprint
+
+"""
+Created on Sat Oct 17 16:40:05 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+# Statistics per dataset fingerprint, shared by every section and session
+STATSCACHE = KeyedCache(max_entries = 32)
+
+def quantile_from_counts(values : np.ndarray, counts : np.ndarray, q : float) -> float:
+    # Same linear interpolation as np.percentile, on a sorted value / count table
+    position = (counts.sum() - 1) * q
+    cumcount = np.cumsum(counts)
+    lower = values[np.searchsorted(cumcount, np.floor(position), side = 'right')]
+    upper = values[np.searchsorted(cumcount, np.ceil(position), side = 'right')]
+    return float(lower + (upper - lower) * (position - np.floor(position)))
+
+class DescriptiveStatistics():
+
+    def __init__(self, **parameter):
+        # Mergeable state : row count, mean vector, co-moment matrix and a value count table
+        # per column (mode, extrema and quantiles are read from the table)
+        self.columns = list(parameter.get('columns', []))
+        self.n       = parameter.get('n', 0)
+        self.mean    = parameter.get('mean', np.zeros(len(self.columns)))
+        self.comoment = parameter.get('comoment', np.zeros((len(self.columns), len(self.columns))))
+        self.counts  = parameter.get('counts', {column : pd.Series(dtype = 'int64') for column in self.columns})
+
+    @classmethod
+    def from_data(cls, data : pd.DataFrame):
+        matrix   = data.to_numpy(dtype = 'float64')
+        mean     = matrix.mean(axis = 0) if len(matrix) else np.zeros(matrix.shape[1])
+        centered = matrix - mean
+
+        counts = {}
+        for index, column in enumerate(data.columns):
+            counts[column] = pd.Series(matrix[:, index]).value_counts(sort = False).sort_index()
+
+        return cls(columns = data.columns,
+                   n = len(matrix),
+                   mean = mean,
+                   comoment = centered.T @ centered,
+                   counts = counts)
+
+    def merge(self, other):
+        # Pairwise update of mean and co-moment (Chan et al.), count tables are added
+        if(other.n == 0):
+            return self
+        if(self.n == 0):
+            self.n, self.mean, self.comoment, self.counts = other.n, other.mean, other.comoment, other.counts
+            return self
+
+        n     = self.n + other.n
+        delta = other.mean - self.mean
+        self.comoment = self.comoment + other.comoment + np.outer(delta, delta) * self.n * other.n / n
+        self.mean     = self.mean + delta * other.n / n
+        self.n        = n
+        self.counts   = {column : self.counts[column].add(other.counts[column], fill_value = 0).astype('int64')
+                         for column in self.columns}
+        return self
+
+    def correlation(self) -> pd.DataFrame:
+        std = np.sqrt(np.diag(self.comoment))
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            correlation = self.comoment / np.outer(std, std)
+        return pd.DataFrame(correlation, index = self.columns, columns = self.columns)
+
+    def summary(self) -> pd.DataFrame:
+        std = np.sqrt(np.diag(self.comoment) / max(self.n - 1, 1))
+
+        summary = []
+        for index, column in enumerate(self.columns):
+            counts = self.counts[column]
+            values = counts.index.to_numpy(dtype = 'float64')
+            counts = counts.to_numpy()
+            summary.append(dict(mean = self.mean[index],
+                                std = std[index],
+                                min = values[0],
+                                max = values[-1],
+                                mode = values[counts.argmax()],
+                                q25 = quantile_from_counts(values, counts, 0.25),
+                                median = quantile_from_counts(values, counts, 0.5),
+                                q75 = quantile_from_counts(values, counts, 0.75)))
+
+        return pd.DataFrame(summary, index = self.columns)
+
+def describe(data : pd.DataFrame, key : tuple = None) -> DescriptiveStatistics:
+    # key identifies the dataset the frame was derived from (saves hashing it on every rerun),
+    # without it the frame itself is fingerprinted
+    cachekey = (key, tuple(data.columns)) if key is not None else fingerprint(data)
+    return STATSCACHE.get_or_compute(cachekey, lambda: DescriptiveStatistics.from_data(data))
@@ -0,0 +1,90 @@
+import os
+import gzip
+import hashlib
+import pandas as pd
+from cache import KeyedCache
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+"""
+Created on Sat Oct 17 19:48:22 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+# Export format per extension, with mime type for the download button
+FORMATS = {'.parquet' : 'application/octet-stream',
+           '.arrow'   : 'application/vnd.apache.arrow.file',
+           '.csv.gz'  : 'application/gzip',
+           '.csv'     : 'text/csv'}
+
+def export_format(path : str) -> str:
+    for extension in FORMATS:
+        if(path.endswith(extension)):
+            return extension
+    raise ValueError('Unknown export format of {}, use one of : {}'.format(path, ', '.join(FORMATS)))
+
+def iter_frames(data : pd.DataFrame, chunksize : int):
+    for start in range(0, max(len(data), 1), chunksize):
+        yield data.iloc[start:start + chunksize]
+
+def export_frame(data : pd.DataFrame, path : str, chunksize : int = 100_000) -> str:
+    # Written chunk by chunk (one row group / record batch / csv block at a time) into a
+    # temporary file that replaces path when complete, memory stays bounded by chunksize
+    extension = export_format(path)
+    if(extension in ['.parquet', '.arrow'] and pyarrow is None):
+        raise ImportError('pyarrow is needed to export {}'.format(extension))
+
+    temporary = path + '.tmp'
+    if(extension == '.parquet'):
+        writer = None
+        for chunk in iter_frames(data, chunksize):
+            table  = pyarrow.Table.from_pandas(chunk, preserve_index = False)
+            writer = writer or pyarrow.parquet.ParquetWriter(temporary, table.schema)
+            writer.write_table(table)
+        writer.close()
+    elif(extension == '.arrow'):
+        writer = None
+        with pyarrow.OSFile(temporary, 'wb') as sink:
+            for chunk in iter_frames(data, chunksize):
+                table  = pyarrow.Table.from_pandas(chunk, preserve_index = False)
+                writer = writer or pyarrow.ipc.new_file(sink, table.schema)
+                writer.write_table(table)
+            writer.close()
+    else:
+        # gzip level 6 : close to the default level 9 in size, several times faster
+        file = gzip.open(temporary, 'wt', newline = '', compresslevel = 6) if extension == '.csv.gz' \
+               else open(temporary, 'w', newline = '')
+        with file:
+            for index, chunk in enumerate(iter_frames(data, chunksize)):
+                chunk.to_csv(file, header = index == 0, index = False)
+
+    os.replace(temporary, path)
+    return path
+
+def remove_export(key, path : str):
+    if(os.path.exists(path)):
+        os.remove(path)
+
+# Exported files on disk per (model / dataset fingerprint, format), the cache holds only the path
+EXPORTCACHE = KeyedCache(max_entries = 16,
+                         max_bytes = 2 * 1024 ** 3,
+                         sizeof = lambda path: os.path.getsize(path),
+                         on_evict = remove_export)
+
+def cached_export(key : tuple, data : pd.DataFrame, extension : str = '.parquet', **parameter) -> str:
+    # key identifies the content (e.g. fingerprint of the centroids and labels), the frame
+    # itself is not hashed. Returns the path of the exported file.
+    defaultdir = os.path.join(os.path.expanduser('~'), '.cache', 'rfm_kmeans')
+    exportdir  = os.path.join(parameter.get('cachedir') or os.environ.get('RFM_CACHEDIR', defaultdir), 'exports')
+    os.makedirs(exportdir, exist_ok = True)
+
+    name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + extension
+    return EXPORTCACHE.get_or_compute(key + (extension,),
+                                      lambda: export_frame(data, os.path.join(exportdir, name),
+                                                           chunksize = parameter.get('chunksize', 100_000)))
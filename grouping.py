@@ -0,0 +1,115 @@
+import os
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import modelling as model
+import scoring as sc
+from cache import KeyedCache
+from aggregation import GroupIndex
+from scoring import cluster_category
+
+"""
+Created on Sat Oct 17 19:12:37 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+# Grouped segmentation results, keyed by the caller (dataset, filter, attribute and parameters)
+GROUPCACHE = KeyedCache(max_entries = 8)
+
+def split_groups(groupindex : GroupIndex, attribute : str, values : list = None, **filters) -> dict:
+    # R-F-M of every group within filters, merged from the group index partials
+    # (a customer buying in several groups is in every one of them)
+    values = values or filters.pop(attribute, None) or list(groupindex.categories[attribute])
+    groups = {value : groupindex.get_aggregation(**dict(filters, **{attribute : value})) for value in values}
+    return {value : data for value, data in groups.items() if not data.empty}
+
+def group_worker(matrixname : str, labelname : str, shape : tuple, start : int, stop : int,
+                 clustertype : str, set_params : dict) -> dict:
+    # Fit one group on its rows of the shared matrix, labels are written to the shared output
+    from threadpoolctl import threadpool_limits
+
+    matrixmemory = shared_memory.SharedMemory(name = matrixname)
+    labelmemory  = shared_memory.SharedMemory(name = labelname)
+    try:
+        matrix = np.ndarray(shape, dtype = 'float64', buffer = matrixmemory.buf)
+        labels = np.ndarray(shape[0], dtype = 'int32', buffer = labelmemory.buf)
+
+        # One core per process, the pool itself spreads the groups over the cores
+        with threadpool_limits(limits = 1):
+            modelrfm = model.Modelling(data = matrix[start:stop], usecache = False)
+            fitmodel = modelrfm.clustering(clustertype = clustertype,
+                                           set_params = dict(set_params, n_clusters = min(set_params.get('n_clusters', 5), stop - start)))
+
+        labels[start:stop] = fitmodel.labels_
+        result = dict(cluster_centers_ = np.asarray(fitmodel.cluster_centers_, dtype = 'float64'),
+                      scaling = modelrfm.scaling,
+                      fitreport = modelrfm.fitreport)
+        del matrix, labels
+        return result
+    finally:
+        matrixmemory.close()
+        labelmemory.close()
+
+def grouped_modelling(groups : dict, clustertype : str = 'kmeans', set_params : dict = {}, **parameter) -> tuple:
+    # Scaler + K-Means per group in a process pool. Returns the labelled customers of every group
+    # (with a group column) and the cluster_category table per group. One fit per group : the
+    # pool already uses every core, a restart pool per group would oversubscribe them.
+    workers    = parameter.get('workers', os.cpu_count() or 1)
+    set_params = {key : value for key, value in set_params.items() if key != 'n_restarts'}
+    names   = list(groups)
+    sizes   = np.array([len(groups[name]) for name in names], dtype = 'int64')
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    shape   = (int(offsets[-1]), 3)
+
+    matrixmemory = shared_memory.SharedMemory(create = True, size = max(1, shape[0] * shape[1] * 8))
+    labelmemory  = shared_memory.SharedMemory(create = True, size = max(1, shape[0] * 4))
+    try:
+        matrix = np.ndarray(shape, dtype = 'float64', buffer = matrixmemory.buf)
+        for name, start, stop in zip(names, offsets[:-1], offsets[1:]):
+            matrix[start:stop] = groups[name][['recency', 'frequency', 'monetary']].to_numpy(dtype = 'float64')
+
+        # Largest groups first, so the last tasks to finish are the short ones
+        tasks = [(matrixmemory.name, labelmemory.name, shape, int(offsets[index]), int(offsets[index + 1]),
+                  clustertype, set_params) for index in np.argsort(-sizes, kind = 'stable')]
+        if(workers > 1 and len(tasks) > 1):
+            with ProcessPoolExecutor(max_workers = min(workers, len(tasks))) as pool:
+                futures = {task[3] : pool.submit(group_worker, *task) for task in tasks}
+                fitted  = {start : future.result() for start, future in futures.items()}
+        else:
+            fitted = {task[3] : group_worker(*task) for task in tasks}
+
+        labels = np.ndarray(shape[0], dtype = 'int32', buffer = labelmemory.buf).copy()
+        del matrix
+    finally:
+        matrixmemory.close()
+        matrixmemory.unlink()
+        labelmemory.close()
+        labelmemory.unlink()
+
+    listresult, categories = [], {}
+    clusters = ['Cluster ' + str(index + 1) for index in range(max([len(result['cluster_centers_']) for result in fitted.values()], default = 0))]
+    for name, start, stop in zip(names, offsets[:-1], offsets[1:]):
+        data, result = groups[name], fitted[int(start)]
+
+        cluster_center = pd.DataFrame(result['cluster_centers_'], columns = ['R', 'F', 'M'])
+        cluster_center = cluster_category(cluster_center,
+                                          edges = sc.get_edges(data),
+                                          rawcentroid = sc.unscale(result['cluster_centers_'], result['scaling']))
+        cluster_center.insert(0, 'group', name)
+        categories[name] = cluster_center
+
+        grouplabel = labels[start:stop]
+        data = data.assign(group = name,
+                           cluster = pd.Categorical.from_codes(grouplabel, categories = clusters, ordered = True),
+                           cluster_category = cluster_center['cluster_category'].to_numpy()[grouplabel])
+        listresult.append(data)
+
+    result = pd.concat(listresult, ignore_index = True) if listresult else pd.DataFrame()
+    if(listresult):
+        result['group'] = pd.Categorical(result['group'], categories = names)
+        result = result.sort_values(by = ['group', 'cluster', 'customer_id'], ignore_index = True)
+        result = result[['group', 'cluster', 'cluster_category'] + [column for column in result.columns
+                                                                      if column not in ['group', 'cluster', 'cluster_category']]]
+    return result, categories
@@ -0,0 +1,73 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Created on Sat Oct 17 20:21:05 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+class FitCancelled(Exception):
+    pass
+
+class FitJob():
+
+    def __init__(self, key, function, total : int = None):
+        # function(job) runs in the pool and passes job.report as the fit callback
+        self.key       = key
+        self.function  = function
+        self.total     = total
+        self.progress  = dict(iteration = 0, inertia = None)
+        self.cancelled = threading.Event()
+        self.future    = None
+
+    def report(self, iteration : int, inertia : float):
+        # Fit callback, raising here stops the fit at its next step
+        if(self.cancelled.is_set()):
+            raise FitCancelled(self.key)
+        self.progress = dict(iteration = iteration, inertia = inertia)
+
+    def run(self):
+        if(self.cancelled.is_set()):
+            raise FitCancelled(self.key)
+        return self.function(self)
+
+    def cancel(self):
+        self.cancelled.set()
+        if(self.future is not None):
+            self.future.cancel()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def failed(self) -> bool:
+        return self.done() and (self.future.cancelled() or self.future.exception() is not None)
+
+    def result(self, timeout : float = None):
+        return self.future.result(timeout = timeout)
+
+    def fraction(self) -> float:
+        if(self.total is None or self.total <= 0):
+            return 0.0
+        return min(self.progress['iteration'] / self.total, 1.0)
+
+class JobRunner():
+
+    def __init__(self, **parameter):
+        # Fits of every session share this pool, a session keeps one current job
+        self.pool = ThreadPoolExecutor(max_workers = parameter.get('max_workers', 2),
+                                       thread_name_prefix = 'fit')
+
+    def submit(self, current : FitJob, key, function, total : int = None) -> FitJob:
+        # Same key keeps the running (or finished) job, a new key cancels the stale one
+        if(current is not None and current.key == key and not current.failed()):
+            return current
+        if(current is not None):
+            current.cancel()
+
+        job = FitJob(key, function, total = total)
+        job.future = self.pool.submit(job.run)
+        return job
+
+# Background fitting pool of the Streamlit app
+FITJOBS = JobRunner(max_workers = 2)
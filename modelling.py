@@ -1,8 +1,13 @@
+import os
 import re
+import time
 import numpy as np
 import pandas as pd
-from sklearn import preprocessing
-from sklearn.cluster import KMeans
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cache import KeyedCache, fingerprint
+from profiling import PROFILER, TRACEDPEAK
+import scoring as sc
 
 """
 Created on Thu May 26 09:41:45 2022
@@ -10,24 +15,551 @@ Created on Thu May 26 09:41:45 2022
 @author: Bachtiyar M. Arief
 """
 
+# scikit-learn is imported on first use, importing this module stays cheap
+def sklearn_preprocessing():
+    from sklearn import preprocessing
+    return preprocessing
+
+def sklearn_cluster():
+    from sklearn import cluster
+    return cluster
+
+def sizeof_model(value : tuple) -> int:
+    model, scaling = value
+    return model.labels_.nbytes + model.cluster_centers_.nbytes + 4096
+
+def scaling_params(scaler, nfeatures : int) -> dict:
+    # Every scaler used here is an affine map : scaled = (data - center) / scale
+    center = np.zeros(nfeatures)
+    scale  = np.ones(nfeatures)
+    scalername = type(scaler).__name__
+    if(scalername == 'StandardScaler'):
+        center, scale = scaler.mean_, scaler.scale_
+    elif(scalername == 'MinMaxScaler'):
+        center, scale = -scaler.min_ / scaler.scale_, 1 / scaler.scale_
+    elif(scalername == 'MaxAbsScaler'):
+        scale = scaler.scale_
+    elif(scalername in ['RobustScaler', 'ChunkScaler']):
+        center, scale = scaler.center_, scaler.scale_
+    return dict(center = np.asarray(center, dtype = 'float64'), scale = np.asarray(scale, dtype = 'float64'))
+
+def scaler_kind(scalertype : str) -> str:
+    scalertype = re.sub('[^a-z]', '', scalertype.lower())
+    if('minmax' in scalertype):
+        return 'minmax'
+    elif('maximumabsolute' in scalertype or 'maxabs' in scalertype):
+        return 'maxabs'
+    elif('robust' in scalertype):
+        return 'robust'
+    return 'standard'
+
+def feature_matrix(data : pd.DataFrame, **parameter) -> np.ndarray:
+    # R-F-M as one C-contiguous (n, 3) array, float32 by default, optionally a .npy memmap (path)
+    columns = parameter.get('columns', ['recency', 'frequency', 'monetary'])
+    dtype   = parameter.get('dtype', 'float32')
+    shape   = (len(data), len(columns))
+    if(parameter.get('path')):
+        matrix = np.lib.format.open_memmap(parameter.get('path'), mode = 'w+', dtype = dtype, shape = shape)
+    else:
+        matrix = np.empty(shape, dtype = dtype)
+    
+    # Filled column by column, no float64 copy of the whole frame
+    for index, column in enumerate(columns):
+        matrix[:, index] = data[column].to_numpy()
+    return matrix
+
+def iter_chunks(data, chunksize : int):
+    # (start, float64 block) of a frame or array, only one block is materialized at a time
+    for start in range(0, len(data), chunksize):
+        block = data.iloc[start:start + chunksize] if isinstance(data, pd.DataFrame) else data[start:start + chunksize]
+        yield start, np.asarray(block, dtype = 'float64')
+
+class QuantileSketch():
+    
+    def __init__(self, **parameter):
+        # Weighted centroids sorted by value, at most capacity of them. Every compression
+        # merges neighbours into equal weight bins, so the rank error stays about 1 / capacity.
+        self.capacity = parameter.get('capacity', 4096)
+        self.values   = np.empty(0)
+        self.weights  = np.empty(0)
+        self.min      = np.inf
+        self.max      = -np.inf
+    
+    def update(self, values : np.ndarray, weights : np.ndarray = None):
+        values = np.asarray(values, dtype = 'float64')
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype = 'float64')
+        isvalid = ~np.isnan(values)
+        values, weights = values[isvalid], weights[isvalid]
+        if(len(values) == 0):
+            return self
+        
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        
+        values  = np.concatenate([self.values, values])
+        weights = np.concatenate([self.weights, weights])
+        order   = np.argsort(values, kind = 'stable')
+        values, weights = values[order], weights[order]
+        
+        if(len(values) > self.capacity):
+            cumweight = np.cumsum(weights)
+            bins      = np.minimum(((cumweight - weights / 2) / cumweight[-1] * self.capacity).astype('int64'),
+                                   self.capacity - 1)
+            binweight = np.bincount(bins, weights = weights, minlength = self.capacity)
+            binvalue  = np.bincount(bins, weights = values * weights, minlength = self.capacity)
+            isused    = binweight > 0
+            values, weights = binvalue[isused] / binweight[isused], binweight[isused]
+        
+        self.values, self.weights = values, weights
+        return self
+    
+    def merge(self, other):
+        self.update(other.values, other.weights)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+    
+    def quantile(self, q) -> np.ndarray:
+        # Linear interpolation between centroid midpoints, the extrema are exact
+        total  = self.weights.sum()
+        rank   = np.concatenate([[0], np.cumsum(self.weights) - self.weights / 2, [total]])
+        values = np.concatenate([[self.min], self.values, [self.max]])
+        return np.interp(np.asarray(q) * total, rank, values)
+
+class ChunkScaler():
+    
+    def __init__(self, scalertype : str, **parameter):
+        # Scaler fitted chunk by chunk : partial_fit of the scikit-learn scaler, or per
+        # column QuantileSketch (approximate median and IQR) for the robust scaler
+        self.kind     = scaler_kind(scalertype)
+        self.capacity = parameter.get('capacity', 4096)
+        self.sketches = None
+        preprocessing = sklearn_preprocessing()
+        self.scaler   = dict(standard = preprocessing.StandardScaler,
+                             minmax = preprocessing.MinMaxScaler,
+                             maxabs = preprocessing.MaxAbsScaler).get(self.kind, lambda: None)()
+    
+    def partial_fit(self, data : np.ndarray):
+        if(self.scaler is not None):
+            self.scaler.partial_fit(data)
+            return self
+        
+        if(self.sketches is None):
+            self.sketches = [QuantileSketch(capacity = self.capacity) for _ in range(data.shape[1])]
+        for column, sketch in enumerate(self.sketches):
+            sketch.update(data[:, column])
+        return self
+    
+    def fit(self, data, chunksize : int = 1_000_000):
+        for start, block in iter_chunks(data, chunksize):
+            self.partial_fit(block)
+        return self
+    
+    @property
+    def center_(self) -> np.ndarray:
+        if(self.scaler is None):
+            return np.array([sketch.quantile(0.5) for sketch in self.sketches])
+        return scaling_params(self.scaler, self.scaler.n_features_in_)['center']
+    
+    @property
+    def scale_(self) -> np.ndarray:
+        if(self.scaler is None):
+            scale = np.array([np.diff(sketch.quantile([0.25, 0.75]))[0] for sketch in self.sketches])
+            return np.where(scale == 0, 1, scale)
+        return scaling_params(self.scaler, self.scaler.n_features_in_)['scale']
+    
+    def transform(self, data, out : np.ndarray = None, chunksize : int = 1_000_000) -> np.ndarray:
+        # out can be data itself (in place), a preallocated array or a memmap, default float32
+        center, scale = self.center_, self.scale_
+        if(out is None):
+            out = np.empty(np.shape(data), dtype = 'float32')
+        for start, block in iter_chunks(data, chunksize):
+            out[start:start + len(block)] = (block - center) / scale
+        return out
+
+# Fitted models shared by every session, keyed by data fingerprint and hyperparameters
+MODELCACHE = KeyedCache(max_entries = 64,
+                        max_bytes = 512 * 1024 ** 2,
+                        sizeof = sizeof_model)
+
+# k-sweep diagnostics, small frames keyed the same way as MODELCACHE
+SWEEPCACHE = KeyedCache(max_entries = 32)
+
+class FittedModel():
+    
+    def __init__(self, **parameter):
+        # Fitted result restored from disk, same attributes as a fitted KMeans
+        self.cluster_centers_ = parameter.get('cluster_centers_')
+        self.labels_          = parameter.get('labels_')
+        self.inertia_         = parameter.get('inertia_')
+        self.n_iter_          = parameter.get('n_iter_')
+
+class NumpyKMeans():
+    
+    def __init__(self, **parameter):
+        self.n_clusters   = parameter.get('n_clusters', 6)
+        self.max_iter     = parameter.get('max_iter', 300)
+        self.tol          = parameter.get('tol', 1e-4)
+        self.batch_size   = parameter.get('batch_size', 65536)
+        self.random_state = parameter.get('random_state', 42)
+        self.init         = parameter.get('init', 'k-means++')
+    
+    def __assign(self, data : np.ndarray, centers : np.ndarray, sqnorms : np.ndarray = None):
+        # Nearest center per row, distance matrix is only built batch_size rows at a time
+        labels  = np.empty(len(data), dtype = 'int64')
+        mindist = np.empty(len(data), dtype = 'float64')
+        centernorm = (centers ** 2).sum(axis = 1)
+        
+        for start in range(0, len(data), self.batch_size):
+            batch = data[start:start + self.batch_size]
+            distance = centernorm - 2 * batch @ centers.T
+            labels[start:start + len(batch)]  = distance.argmin(axis = 1)
+            mindist[start:start + len(batch)] = distance[np.arange(len(batch)), labels[start:start + len(batch)]]
+        
+        mindist += (data ** 2).sum(axis = 1) if sqnorms is None else sqnorms
+        return labels, np.maximum(mindist, 0)
+    
+    def __init_centers(self, data : np.ndarray, random : np.random.Generator) -> np.ndarray:
+        # k-means++ seeding
+        centers = [data[random.integers(len(data))]]
+        closest = ((data - centers[0]) ** 2).sum(axis = 1)
+        for _ in range(1, self.n_clusters):
+            probability = closest / closest.sum() if closest.sum() > 0 else None
+            centers.append(data[random.choice(len(data), p = probability)])
+            closest = np.minimum(closest, ((data - centers[-1]) ** 2).sum(axis = 1))
+        return np.array(centers)
+    
+    def fit(self, data, sqnorms : np.ndarray = None):
+        # sqnorms : precomputed squared norm of every row, shared between restarts
+        data    = np.asarray(data)
+        data    = data if data.dtype in ['float32', 'float64'] else data.astype('float64')
+        random  = np.random.default_rng(self.random_state)
+        centers = self.__init_centers(data, random) if isinstance(self.init, str) else np.asarray(self.init, dtype = 'float64')
+        tol     = self.tol * data.var(axis = 0).mean()
+        
+        for iteration in range(1, self.max_iter + 1):
+            labels, mindist = self.__assign(data, centers, sqnorms)
+            
+            # Mean of every cluster, empty cluster keeps its previous center
+            counts = np.bincount(labels, minlength = self.n_clusters)
+            sums   = np.stack([np.bincount(labels, weights = data[:, j], minlength = self.n_clusters)
+                               for j in range(data.shape[1])], axis = 1)
+            newcenters = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+            
+            shift   = ((newcenters - centers) ** 2).sum()
+            centers = newcenters
+            if(shift <= tol):
+                break
+        
+        self.cluster_centers_ = centers
+        self.labels_, mindist = self.__assign(data, centers, sqnorms)
+        self.inertia_ = float(mindist.sum())
+        self.n_iter_  = iteration
+        return self
+    
+    def predict(self, data) -> np.ndarray:
+        data = np.asarray(data)
+        return self.__assign(data if data.dtype in ['float32', 'float64'] else data.astype('float64'), self.cluster_centers_)[0]
+
+def init_params(parameter : dict) -> dict:
+    # k-means++ by default, a centroid array (warm start) is used as is with a single init
+    init = parameter.get('init', 'k-means++')
+    return dict(init = init) if isinstance(init, str) else dict(init = init, n_init = 1)
+
+def build_lloyd(**parameter):
+    return sklearn_cluster().KMeans(n_clusters = parameter.get('n_clusters'), 
+                                    max_iter = parameter.get('iterations'),
+                                    algorithm = 'lloyd',
+                                    random_state = parameter.get('random_state'),
+                                    **init_params(parameter))
+
+def build_elkan(**parameter):
+    return sklearn_cluster().KMeans(n_clusters = parameter.get('n_clusters'), 
+                                    max_iter = parameter.get('iterations'),
+                                    algorithm = 'elkan',
+                                    random_state = parameter.get('random_state'),
+                                    **init_params(parameter))
+
+def build_minibatch(**parameter):
+    return sklearn_cluster().MiniBatchKMeans(n_clusters = parameter.get('n_clusters'), 
+                                             max_iter = parameter.get('iterations'),
+                                             batch_size = parameter.get('batch_size') or 4096,
+                                             random_state = parameter.get('random_state'),
+                                             **init_params(parameter))
+
+def build_numpy(**parameter):
+    return NumpyKMeans(n_clusters = parameter.get('n_clusters'), 
+                       max_iter = parameter.get('iterations'),
+                       batch_size = parameter.get('batch_size') or 65536,
+                       random_state = parameter.get('random_state'),
+                       init = parameter.get('init', 'k-means++'))
+
+# Clustering engine per clustertype (lowercase, letters only)
+ENGINES = dict(kmeans          = build_lloyd,
+               lloyd           = build_lloyd,
+               elkan           = build_elkan,
+               minibatch       = build_minibatch,
+               minibatchkmeans = build_minibatch,
+               numpy           = build_numpy,
+               numpykmeans     = build_numpy)
+
+def register_engine(clustertype : str, builder):
+    ENGINES[re.sub('[^a-z]', '', clustertype.lower())] = builder
+
+def fit_stepwise(builder, data : np.ndarray, callback, step : int = 10, **parameter):
+    # Fit in blocks of step iterations, every block starts from the centroids of the previous
+    # one. callback(iteration, inertia) runs after every block and may raise to stop the fit.
+    iterations = parameter.get('iterations', 300)
+    init, total = parameter.get('init', 'k-means++'), 0
+    while(True):
+        blocksize = min(step, iterations - total)
+        model = builder(**dict(parameter, iterations = blocksize, init = init)).fit(data)
+        total += int(model.n_iter_)
+        callback(total, float(model.inertia_))
+        if(model.n_iter_ < blocksize or total >= iterations):
+            break
+        init = model.cluster_centers_
+    
+    model.n_iter_ = total
+    return model
+
+def share_array(shape : tuple, dtype : str) -> tuple:
+    # New shared memory block and the array on it, the caller closes and unlinks the block
+    size   = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    memory = shared_memory.SharedMemory(create = True, size = size)
+    return memory, np.ndarray(shape, dtype = dtype, buffer = memory.buf)
+
+def attach_array(name : str, shape : tuple, dtype : str) -> tuple:
+    # Array on an existing shared memory block (no copy), the caller closes the block
+    memory = shared_memory.SharedMemory(name = name)
+    return memory, np.ndarray(shape, dtype = dtype, buffer = memory.buf)
+
+def restart_worker(names : tuple, shape : tuple, dtype : str, index : int, seed : int, clustertype : str, engineparams : dict) -> dict:
+    # One seeded restart on the shared scaled matrix : k-means++ seeding with the shared squared
+    # norms, then the engine from these centroids. Labels go to row index of the shared label matrix.
+    from threadpoolctl import threadpool_limits
+    
+    matrixname, normname, labelname, nrestart = names
+    memories, (matrix, sqnorms, labels) = zip(*[attach_array(matrixname, shape, dtype),
+                                                 attach_array(normname, shape[:1], 'float64'),
+                                                 attach_array(labelname, (nrestart, shape[0]), 'int32')])
+    try:
+        with threadpool_limits(limits = 1):
+            init  = sklearn_cluster().kmeans_plusplus(matrix, engineparams.get('n_clusters'), x_squared_norms = sqnorms,
+                                                      random_state = seed)[0]
+            model = ENGINES[clustertype](**dict(engineparams, init = init, random_state = seed))
+            model = model.fit(matrix, sqnorms = sqnorms) if isinstance(model, NumpyKMeans) else model.fit(matrix)
+        
+        labels[index] = model.labels_
+    finally:
+        # Arrays on the blocks must be gone before the blocks are closed
+        del matrix, sqnorms, labels
+        for memory in memories:
+            memory.close()
+    
+    return dict(index = index,
+                seed = seed,
+                inertia = float(model.inertia_),
+                n_iter = int(model.n_iter_),
+                cluster_centers_ = np.asarray(model.cluster_centers_, dtype = 'float64'))
+
+def report_restart(callback, runs : list):
+    if(callback is not None):
+        callback(len(runs), min(run['inertia'] for run in runs))
+
+def match_centers(reference : np.ndarray, centers : np.ndarray) -> np.ndarray:
+    # Cluster of centers matched to every reference cluster (minimum total squared distance)
+    from scipy.optimize import linear_sum_assignment
+    distance = ((reference[:, None] - centers[None]) ** 2).sum(axis = 2)
+    row, column = linear_sum_assignment(distance)
+    return column[np.argsort(row)]
+
+def warm_start(data : np.ndarray, centers : np.ndarray, random : np.random.Generator) -> np.ndarray:
+    # Centers of the previous k plus one new center drawn k-means++ style
+    closest = np.full(len(data), np.inf)
+    for center in centers:
+        closest = np.minimum(closest, ((data - center) ** 2).sum(axis = 1))
+    
+    probability = closest / closest.sum() if closest.sum() > 0 else None
+    return np.vstack([centers, data[random.choice(len(data), p = probability)]])
+
+def sweep_worker(datamodel : np.ndarray, listk : list, **parameter) -> list:
+    # Fit every k in order on one scaled matrix, scores use the same row sample for every k
+    random     = np.random.default_rng(parameter.get('random_state', 42))
+    samplesize = min(parameter.get('sample_size', 10000), len(datamodel))
+    sample     = random.choice(len(datamodel), samplesize, replace = False)
+    
+    from sklearn import metrics
+    KMeans = sklearn_cluster().KMeans
+    
+    result, centers = [], None
+    for k in listk:
+        if(parameter.get('warmstart', True) and centers is not None and len(centers) == k - 1):
+            model = KMeans(n_clusters = k, init = warm_start(datamodel, centers, random), n_init = 1,
+                           max_iter = parameter.get('iterations', 300))
+        else:
+            model = KMeans(n_clusters = k, init = 'k-means++', n_init = 1,
+                           max_iter = parameter.get('iterations', 300),
+                           random_state = parameter.get('random_state', 42))
+        
+        starttime = time.perf_counter()
+        model.fit(datamodel)
+        fit_time  = time.perf_counter() - starttime
+        centers   = model.cluster_centers_
+        
+        labels = model.labels_[sample]
+        isvalid = 1 < len(np.unique(labels)) < samplesize
+        result.append(dict(scalertype = parameter.get('scalertype'),
+                           n_clusters = k,
+                           inertia = float(model.inertia_),
+                           silhouette = metrics.silhouette_score(datamodel[sample], labels) if isvalid else np.nan,
+                           davies_bouldin = metrics.davies_bouldin_score(datamodel[sample], labels) if isvalid else np.nan,
+                           n_iter = int(model.n_iter_),
+                           fit_time = fit_time))
+    return result
+
+def precision_report(data : pd.DataFrame, clustertype : str, set_params : dict, dtype : str = 'float32') -> dict:
+    # Same fit on the float64 frame and on an in place scaled dtype matrix : traced peak memory
+    # of scaling + clustering (TRACEDPEAK, so a profiler stage open around it keeps its own
+    # measurement) and share of customers whose (matched) cluster changed
+    from sklearn import metrics
+    
+    fitted = {}
+    for precision in ['float64', dtype]:
+        token = TRACEDPEAK.start()
+        if(precision == 'float64'):
+            modelrfm = Modelling(data = data, usecache = False)
+            params   = set_params
+        else:
+            modelrfm = Modelling(data = feature_matrix(data, dtype = dtype), usecache = False)
+            params   = dict(set_params, chunksize = set_params.get('chunksize') or 65536, scaledpath = 'inplace')
+        result = modelrfm.clustering(clustertype = clustertype, set_params = params)
+        peak, start = TRACEDPEAK.stop(token)
+        peak -= start
+        
+        centers = np.asarray(result.cluster_centers_, dtype = 'float64') * modelrfm.scaling['scale'] + modelrfm.scaling['center']
+        fitted[precision] = (np.asarray(result.labels_), centers, peak)
+    
+    labels64, centers64, peak64 = fitted['float64']
+    labels32, centers32, peak32 = fitted[dtype]
+    
+    # Cluster ids may be permuted, every cluster is matched to the nearest float64 centroid
+    # (in original units, relative to the spread of every feature)
+    spread  = np.maximum(centers64.std(axis = 0), 1e-12)
+    match   = (((centers32[:, None] - centers64[None]) / spread) ** 2).sum(axis = 2).argmin(axis = 1)
+    changed = match[labels32] != labels64
+    return dict(dtype = dtype,
+                float64_peak_mb = round(peak64 / 1024 ** 2, 2),
+                peak_mb = round(peak32 / 1024 ** 2, 2),
+                saved_mb = round((peak64 - peak32) / 1024 ** 2, 2),
+                changed = int(changed.sum()),
+                changed_ratio = float(changed.mean()),
+                adjusted_rand = float(metrics.adjusted_rand_score(labels64, labels32)))
+
 class Modelling():
 
     def __init__(self, **parameter):
         self.data = parameter.get('data')
+        
+        # Fitted model is reused for the same data and hyperparameters,
+        # cachedir additionally keeps centroids and labels on disk
+        self.usecache = parameter.get('usecache', True)
+        self.cachedir = parameter.get('cachedir')
+        
+        # Key of the data when the caller already has one, otherwise hashed on first use
+        self.__fingerprint = parameter.get('fingerprint')
+        
+        # Fitted scaler of the last standarization, as center / scale arrays
+        self.scaler  = None
+        self.scaling = scaling_params(None, self.data.shape[1]) if self.data is not None else None
+    
+    def __model_key(self, clustertype : str, set_params : dict) -> tuple:
+        if(self.__fingerprint is None):
+            self.__fingerprint = fingerprint(self.data)
+        
+        scalertype = re.sub('[^a-z]', '', str(set_params.get('scalertype')).lower())
+        return (self.__fingerprint, clustertype,
+                set_params.get('standarization', True) and scalertype,
+                set_params.get('n_clusters', 6),
+                set_params.get('iterations', 300),
+                set_params.get('batch_size'),
+                set_params.get('random_state', 42),
+                set_params.get('chunksize'),
+                set_params.get('n_restarts', 1))
+    
+    def __model_path(self, key : tuple) -> str:
+        name = fingerprint(np.frombuffer(repr(key).encode('utf-8'), dtype = 'uint8'))
+        return os.path.join(self.cachedir, 'model_' + name + '.npz')
+    
+    def __load_model(self, key : tuple) -> tuple:
+        value = MODELCACHE.get(key)
+        if(value is not None or self.cachedir is None or not os.path.exists(self.__model_path(key))):
+            return value
+        
+        with np.load(self.__model_path(key)) as saved:
+            model = FittedModel(cluster_centers_ = saved['cluster_centers_'],
+                                labels_ = saved['labels_'],
+                                inertia_ = float(saved['inertia_']),
+                                n_iter_ = int(saved['n_iter_']))
+            scaling = dict(center = saved['center'], scale = saved['scale'])
+        MODELCACHE.set(key, (model, scaling))
+        return model, scaling
+    
+    def __save_model(self, key : tuple, model, scaling : dict):
+        MODELCACHE.set(key, (model, scaling))
+        if(self.cachedir is not None):
+            os.makedirs(self.cachedir, exist_ok = True)
+            path = self.__model_path(key)
+            np.savez(path + '.tmp.npz',
+                     cluster_centers_ = model.cluster_centers_,
+                     labels_ = model.labels_,
+                     inertia_ = model.inertia_,
+                     n_iter_ = model.n_iter_,
+                     center = scaling['center'],
+                     scale = scaling['scale'])
+            os.replace(path + '.tmp.npz', path)
             
-    def standarization(self, scalertype : str) -> np.ndarray:
-        scalertype = re.sub('[^a-z]', '', scalertype.lower())
+    def standarization(self, scalertype : str, **parameter) -> np.ndarray:
+        # With chunksize the scaler is fitted out of core and the result is written to out :
+        # 'inplace' (self.data as float array), a path of a new float32 memmap, an array or
+        # None (new float32 array)
+        if(parameter.get('chunksize') is not None):
+            return self.__standarization_chunk(scalertype, parameter.get('chunksize'), parameter.get('out'))
+        
+        kind = scaler_kind(scalertype)
+        preprocessing = sklearn_preprocessing()
          
-        if('minmax' in scalertype):
+        if(kind == 'minmax'):
             scaler = preprocessing.MinMaxScaler()
-        elif('maximumabsolute' in scalertype):
+        elif(kind == 'maxabs'):
             scaler = preprocessing.MaxAbsScaler()
-        elif('robust' in scalertype):
+        elif(kind == 'robust'):
             scaler = preprocessing.RobustScaler()
         else:
             scaler = preprocessing.StandardScaler()
             
-        datascaling = scaler.fit_transform(self.data)
+        with PROFILER.stage('scale', rows = len(self.data), scaler = type(scaler).__name__):
+            datascaling = scaler.fit_transform(self.data)
+        
+        self.scaler  = scaler
+        self.scaling = scaling_params(scaler, datascaling.shape[1])
+        return datascaling
+    
+    def __standarization_chunk(self, scalertype : str, chunksize : int, out) -> np.ndarray:
+        with PROFILER.stage('scale', rows = len(self.data), scaler = 'ChunkScaler', chunksize = chunksize):
+            scaler = ChunkScaler(scalertype).fit(self.data, chunksize = chunksize)
+            
+            if(isinstance(out, str) and out == 'inplace'):
+                if(not isinstance(self.data, np.ndarray) or self.data.dtype.kind != 'f'):
+                    raise ValueError('In place scaling needs data as a float numpy array')
+                out = self.data
+            elif(isinstance(out, str)):
+                out = np.lib.format.open_memmap(out, mode = 'w+', dtype = 'float32', shape = self.data.shape)
+            
+            datascaling = scaler.transform(self.data, out = out, chunksize = chunksize)
+        
+        self.scaler  = scaler
+        self.scaling = scaling_params(scaler, datascaling.shape[1])
         return datascaling
     
     def clustering(self, clustertype : str, **parameter) -> pd.DataFrame:
@@ -36,23 +568,219 @@ class Modelling():
         set_params  = parameter.get('set_params')
         isstandartization = set_params.get('standarization', True)
         
+        if(clustertype not in ENGINES):
+            raise ValueError('Unknown clustertype {}, choose one of : {}'.format(clustertype, ', '.join(sorted(ENGINES))))
+        
+        if(self.usecache):
+            modelkey = self.__model_key(clustertype, set_params)
+            cached   = self.__load_model(modelkey)
+            if(cached is not None):
+                result, self.scaling = cached
+                self.fitreport = dict(engine = clustertype,
+                                      fit_time = 0.0,
+                                      n_iter = int(result.n_iter_),
+                                      inertia = float(result.inertia_),
+                                      cached = True)
+                return result
+        
+        if(set_params.get('n_restarts', 1) > 1):
+            result = self.restarts(clustertype, set_params, workers = parameter.get('workers'),
+                                   callback = parameter.get('callback'))
+            if(self.usecache):
+                self.__save_model(modelkey, result, self.scaling)
+            return result
+        
         if(isstandartization):
             scalertype = set_params.get('scalertype')
-            datamodel  = self.standarization(scalertype = scalertype)
+            datamodel  = self.standarization(scalertype = scalertype,
+                                             chunksize = set_params.get('chunksize'),
+                                             out = set_params.get('scaledpath'))
         else:
             datamodel = self.data 
+            self.scaling = scaling_params(None, self.data.shape[1])
+            
+        #Define important parameter
+        engineparams = dict(n_clusters = set_params.get('n_clusters', 6),
+                            iterations = set_params.get('iterations', 300),
+                            batch_size = set_params.get('batch_size'),
+                            random_state = set_params.get('random_state', 42))
+        
+        #Train model, with callback(iteration, inertia) the fit reports progress every step iterations
+        with PROFILER.stage('cluster', rows = len(datamodel), engine = clustertype) as record:
+            starttime = time.perf_counter()
+            if(parameter.get('callback') is None):
+                result = ENGINES[clustertype](**engineparams).fit(datamodel)
+            else:
+                result = fit_stepwise(ENGINES[clustertype], datamodel, parameter.get('callback'),
+                                      step = parameter.get('step', 10), **engineparams)
+            
+            self.fitreport = dict(engine = clustertype,
+                                  fit_time = time.perf_counter() - starttime,
+                                  n_iter = int(result.n_iter_),
+                                  inertia = float(result.inertia_),
+                                  cached = False)
+            record.update(n_iter = self.fitreport['n_iter'], inertia = self.fitreport['inertia'])
+        
+        if(self.usecache):
+            self.__save_model(modelkey, result, self.scaling)
+        return result
+    
+    def restarts(self, clustertype : str, set_params : dict, **parameter) -> FittedModel:
+        # n_restarts seeded fits (random_state, random_state + 1, ...) in a process pool, all on
+        # one scaled matrix and its squared norms in shared memory. The best by inertia is
+        # returned, self.stability (also its stability_) tells how much the restarts agree.
+        # callback(finished restarts, best inertia) runs after every restart and may raise to
+        # stop the fit, the queued restarts are then dropped.
+        clustertype = re.sub('[^a-z]', '', clustertype.lower())
+        callback = parameter.get('callback')
+        nrestart = set_params.get('n_restarts', 8)
+        workers  = parameter.get('workers') or os.cpu_count() or 1
+        seeds    = [set_params.get('random_state', 42) + index for index in range(nrestart)]
+        engineparams = dict(n_clusters = set_params.get('n_clusters', 6),
+                            iterations = set_params.get('iterations', 300),
+                            batch_size = set_params.get('batch_size'))
+        
+        if(set_params.get('standarization', True)):
+            datamodel = self.standarization(scalertype = set_params.get('scalertype'),
+                                            chunksize = set_params.get('chunksize'),
+                                            out = set_params.get('scaledpath'))
+        else:
+            datamodel = np.asarray(self.data)
+            self.scaling = scaling_params(None, datamodel.shape[1])
+        
+        # fit_time leaves the scaling out, as in clustering
+        starttime = time.perf_counter()
+        # Shared matrix keeps the precision of the scaled matrix (float32 stays float32)
+        shape = datamodel.shape
+        dtype = datamodel.dtype.str if datamodel.dtype in ['float32', 'float64'] else '<f8'
+        memories, (matrix, sqnorms, labels) = zip(share_array(shape, dtype),
+                                                  share_array(shape[:1], 'float64'),
+                                                  share_array((nrestart, shape[0]), 'int32'))
+        try:
+            matrix[:] = datamodel
+            del datamodel
+            np.einsum('ij,ij->i', matrix, matrix, out = sqnorms, dtype = 'float64')
+            names = tuple(memory.name for memory in memories) + (nrestart,)
+            tasks = [(names, shape, dtype, index, seed, clustertype, engineparams) for index, seed in enumerate(seeds)]
             
-        if('kmeans' in clustertype):
-            #Define important parameter
-            n_clusters = set_params.get('n_clusters', 6)
-            iterations = set_params.get('iterations', 300)
+            runs = []
+            with PROFILER.stage('restarts', rows = shape[0], engine = clustertype, n_restarts = nrestart):
+                if(workers > 1 and nrestart > 1):
+                    pool = ProcessPoolExecutor(max_workers = min(workers, nrestart))
+                    stopped = True
+                    try:
+                        for future in as_completed([pool.submit(restart_worker, *task) for task in tasks]):
+                            runs.append(future.result())
+                            report_restart(callback, runs)
+                        stopped = False
+                    finally:
+                        # A stopped fit does not wait for the restarts still running
+                        pool.shutdown(wait = not stopped, cancel_futures = True)
+                else:
+                    for task in tasks:
+                        runs.append(restart_worker(*task))
+                        report_restart(callback, runs)
             
-            #Train model
-            modelselected = KMeans(n_clusters = n_clusters, 
-                                   init = 'k-means++', 
-                                   max_iter = iterations,
-                                   random_state = 42)
+            runs = sorted(runs, key = lambda run: run['index'])
+            best = int(np.argmin([run['inertia'] for run in runs]))
+            result = FittedModel(cluster_centers_ = runs[best]['cluster_centers_'],
+                                 labels_ = labels[best].copy(),
+                                 inertia_ = runs[best]['inertia'],
+                                 n_iter_ = runs[best]['n_iter'])
+            result.stability_ = self.stability = self.__stability(matrix, runs, labels, best, **parameter)
+        finally:
+            del matrix, sqnorms, labels
+            for memory in memories:
+                memory.close()
+                memory.unlink()
+        
+        self.fitreport = dict(engine = clustertype,
+                              fit_time = time.perf_counter() - starttime,
+                              n_iter = result.n_iter_,
+                              inertia = result.inertia_,
+                              cached = False,
+                              n_restarts = nrestart,
+                              best_seed = runs[best]['seed'])
+        return result
+    
+    def __stability(self, datamodel : np.ndarray, runs : list, labels : np.ndarray, best : int, **parameter) -> dict:
+        # Adjusted Rand index between every pair of restarts (on a row sample), and per cluster of
+        # the best run : shift of the matched centroid (scaled units) and share of restarts
+        # whose matched centroid gets the same cluster_category
+        from sklearn import metrics
+        
+        random = np.random.default_rng(parameter.get('random_state', 42))
+        sample = random.choice(len(datamodel), min(parameter.get('sample_size', 100_000), len(datamodel)), replace = False)
+        nrun   = len(runs)
+        ari    = np.ones((nrun, nrun))
+        for i in range(nrun):
+            for j in range(i + 1, nrun):
+                ari[i, j] = ari[j, i] = metrics.adjusted_rand_score(labels[i, sample], labels[j, sample])
+        
+        # Quantile edges in original units, quantiles commute with the (increasing) affine scaling
+        edges = {name : sc.quantile_edges(datamodel[:, index]) * self.scaling['scale'][index] + self.scaling['center'][index]
+                 for index, name in enumerate(['R', 'F', 'M'])}
         
-        result = modelselected.fit(datamodel)
+        reference = runs[best]['cluster_centers_']
+        shift, category = [], []
+        for run in runs:
+            centers = run['cluster_centers_'][match_centers(reference, run['cluster_centers_'])]
+            shift.append(np.sqrt(((centers - reference) ** 2).sum(axis = 1)))
+            rawcenters = sc.unscale(centers, self.scaling)
+            category.append(sc.score_segment(rawcenters[:, 0], rawcenters[:, 1], rawcenters[:, 2], edges = edges)['segment'].astype(str).to_numpy())
+        shift, category = np.array(shift), np.array(category)
+        
+        seeds = [run['seed'] for run in runs]
+        return dict(best_seed = seeds[best],
+                    runs = pd.DataFrame(dict(seed = seeds,
+                                             inertia = [run['inertia'] for run in runs],
+                                             n_iter = [run['n_iter'] for run in runs],
+                                             adjusted_rand_best = ari[best])),
+                    adjusted_rand = pd.DataFrame(ari, index = seeds, columns = seeds),
+                    mean_adjusted_rand = float(ari[~np.eye(nrun, dtype = bool)].mean()) if nrun > 1 else 1.0,
+                    clusters = pd.DataFrame(dict(cluster = ['Cluster ' + str(index + 1) for index in range(len(reference))],
+                                                 cluster_category = category[best],
+                                                 centroid_shift_mean = shift.mean(axis = 0),
+                                                 centroid_shift_max = shift.max(axis = 0),
+                                                 category_agreement = (category == category[best]).mean(axis = 0))))
+    
+    def sweep(self, krange = range(2, 11), **parameter) -> pd.DataFrame:
+        # Elbow / silhouette diagnostic over a range of k (and optionally several scaler).
+        # Tasks run in a process pool, with warmstart every task fits a consecutive block
+        # of k in order so each k starts from the centroids of the previous one.
+        scalertypes = parameter.get('scalertypes', [parameter.get('scalertype', 'standardscaler')])
+        workers     = parameter.get('workers', os.cpu_count() or 1)
+        warmstart   = parameter.get('warmstart', True)
+        listk       = sorted(krange)
+        
+        nblock = max(1, workers // len(scalertypes)) if warmstart else len(listk)
+        blocks = [block.tolist() for block in np.array_split(listk, min(nblock, len(listk)))]
+        
+        params = dict(iterations = parameter.get('iterations', 300),
+                      sample_size = parameter.get('sample_size', 10000),
+                      warmstart = warmstart,
+                      random_state = parameter.get('random_state', 42))
+        if(self.usecache):
+            if(self.__fingerprint is None):
+                self.__fingerprint = fingerprint(self.data)
+            sweepkey = (self.__fingerprint, tuple(scalertypes), tuple(listk), tuple(map(tuple, blocks)), tuple(sorted(params.items())))
+            sweep    = SWEEPCACHE.get(sweepkey)
+            if(sweep is not None):
+                return sweep
+        
+        tasks  = [(np.ascontiguousarray(self.standarization(scalertype = scalertype)), scalertype, block)
+                  for scalertype in scalertypes for block in blocks]
+        
+        if(workers > 1 and len(tasks) > 1):
+            with ProcessPoolExecutor(max_workers = min(workers, len(tasks))) as pool:
+                futures = [pool.submit(sweep_worker, datamodel, block, scalertype = scalertype, **params)
+                           for datamodel, scalertype, block in tasks]
+                results = [future.result() for future in futures]
+        else:
+            results = [sweep_worker(datamodel, block, scalertype = scalertype, **params)
+                       for datamodel, scalertype, block in tasks]
         
-        return result
\ No newline at end of file
+        sweep = pd.DataFrame([row for result in results for row in result])
+        if(self.usecache):
+            SWEEPCACHE.set(sweepkey, sweep)
+        return sweep
@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+import data_and_attributes as da
+import modelling as model
+import segmentation as sg
+import export as ex
+import grouping as gp
+from aggregation import GroupIndex, get_aggregation, get_aggregation_stream
+import scoring as sc
+from scoring import cluster_category
+from profiling import PROFILER
+
+"""
+Created on Sat Oct 17 15:10:44 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+def modelling(data : pd.DataFrame, **set_params) -> pd.DataFrame:
+    standarization = set_params.get('standarization', True)
+    scalertype = set_params.get('scalertype', 'standartscaler')
+    n_clusters = set_params.get('n_clusters', 5)
+    iteration  = set_params.get('iteration', 300)
+    engine     = set_params.get('engine', 'kmeans')
+
+    parameters = dict(standarization = standarization,
+                      scalertype = scalertype,
+                      n_clusters = n_clusters,
+                      iterations = iteration,
+                      n_restarts = set_params.get('n_restarts', 1))
+
+    modelrfm = model.Modelling(data = data[['recency', 'frequency', 'monetary']])
+    fitmodel = modelrfm.clustering(clustertype = engine,
+                                   set_params = parameters,
+                                   callback = set_params.get('callback'))
+
+    data = label_cluster(data, fitmodel)
+    return fitmodel, data, modelrfm.scaling
+
+def label_cluster(data : pd.DataFrame, fitmodel) -> pd.DataFrame:
+    # Label as ordered category built from the integer labels, so sorting uses the codes
+    categories = ['Cluster ' + str(index + 1) for index in range(len(fitmodel.cluster_centers_))]
+    data = data.assign(cluster = pd.Categorical.from_codes(np.asarray(fitmodel.labels_),
+                                                           categories = categories,
+                                                           ordered = True))
+    data = data.sort_values(by = ['cluster', 'customer_id'],
+                            ignore_index = True)
+    return data
+
+def export_data(data : pd.DataFrame, path : str, chunksize : int = 100_000):
+    # Format follows the extension : .parquet, .arrow, .csv.gz or .csv, written in chunks
+    ex.export_frame(data, path, chunksize = chunksize)
+
+class Pipeline():
+
+    def __init__(self, **parameter):
+        self.listsource = parameter.get('listsource')
+        self.cachedir   = parameter.get('cachedir')
+        self.stream     = parameter.get('stream', False)
+        self.chunksize  = parameter.get('chunksize', 1_000_000)
+        self.engine     = parameter.get('engine', 'kmeans')
+        self.set_params = dict(standarization = True,
+                               scalertype = parameter.get('scalertype', 'Standard Scaler'),
+                               n_clusters = parameter.get('n_clusters', 5),
+                               iterations = parameter.get('iteration', 300),
+                               n_restarts = parameter.get('n_restarts', 1))
+        
+        # Streamed runs (or a scaledpath memmap) also scale out of core into float32.
+        # dtype float32 builds one contiguous feature matrix (a memmap with scaledpath)
+        # that is scaled in place, compare also fits float64 and reports the difference.
+        self.dtype      = parameter.get('dtype', 'float64')
+        self.scaledpath = parameter.get('scaledpath')
+        self.compare    = parameter.get('compare', False)
+        if(self.stream or self.scaledpath):
+            self.set_params.update(chunksize = self.chunksize,
+                                   scaledpath = self.scaledpath)
+        if(self.dtype != 'float64'):
+            self.set_params.update(chunksize = min(self.chunksize, 65536),
+                                   scaledpath = 'inplace')
+        
+        # groupby fits one model per value of the attribute (province, city or brand)
+        self.groupby = parameter.get('groupby')
+        self.workers = parameter.get('workers')
+        self.timings = {}
+
+    def __stage(self, stage : str, starttime : float) -> float:
+        now = time.perf_counter()
+        self.timings[stage] = round(now - starttime, 4)
+        return now
+
+    def run(self, **parameter) -> pd.DataFrame:
+        # scikit-learn is imported lazily, importing it first keeps its import time out of 'scale'
+        starttime  = time.perf_counter()
+        model.sklearn_preprocessing(), model.sklearn_cluster()
+        starttime  = self.__stage('import', starttime)
+        datasource = da.DataSource(listsource = self.listsource, cachedir = self.cachedir) \
+                     if self.listsource else da.DataSource(cachedir = self.cachedir)
+        
+        if(self.groupby):
+            return self.__run_grouped(datasource, starttime, **parameter)
+
+        if(self.stream):
+            # 1-3. Read, clean and aggregate chunk by chunk
+            rfm_per_cust = get_aggregation_stream(datasource.iter_data(chunksize = self.chunksize))
+            starttime = self.__stage('aggregate', starttime)
+        else:
+            # 1. Load
+            with PROFILER.stage('read', sources = len(datasource.listsource)) as record:
+                data = datasource.read_data()
+                record['rows'] = len(data)
+            starttime = self.__stage('load', starttime)
+
+            # 2. Clean
+            with PROFILER.stage('clean') as record:
+                data = da.clean_data(data)
+                record['rows'] = len(data)
+            starttime = self.__stage('clean', starttime)
+
+            # 3. Aggregate
+            rfm_per_cust = get_aggregation(data[['order_id', 'customer_id', 'order_date', 'total_price']])
+            del data
+            starttime = self.__stage('aggregate', starttime)
+
+        # 4-5. Scale and cluster, fit_time of the engine is the cluster part
+        if(self.dtype != 'float64'):
+            features = model.feature_matrix(rfm_per_cust, dtype = self.dtype, path = self.scaledpath)
+        else:
+            features = rfm_per_cust[['recency', 'frequency', 'monetary']]
+        modelrfm = model.Modelling(data = features)
+        fitmodel = modelrfm.clustering(clustertype = self.engine,
+                                       set_params = self.set_params)
+        elapsed  = time.perf_counter() - starttime
+        self.timings['scale']   = round(elapsed - modelrfm.fitreport['fit_time'], 4)
+        self.timings['cluster'] = round(modelrfm.fitreport['fit_time'], 4)
+        self.timings['n_iter']  = modelrfm.fitreport['n_iter']
+        self.stability = getattr(fitmodel, 'stability_', None)
+        del features
+        
+        if(self.compare and self.dtype != 'float64'):
+            set_params = {key : value for key, value in self.set_params.items() if key not in ['chunksize', 'scaledpath']}
+            self.precision = model.precision_report(rfm_per_cust[['recency', 'frequency', 'monetary']],
+                                                    self.engine, set_params, dtype = self.dtype)
+        starttime = time.perf_counter()
+
+        result = label_cluster(rfm_per_cust, fitmodel)
+
+        # 6. Category per cluster
+        cluster_center = pd.DataFrame(fitmodel.cluster_centers_, columns = ['R', 'F', 'M'])
+        edges = sc.get_edges(result)
+        cluster_center = cluster_category(cluster_center,
+                                          edges = edges,
+                                          rawcentroid = sc.unscale(fitmodel.cluster_centers_, modelrfm.scaling))
+        segment = cluster_center['cluster_category'].to_numpy()
+
+        result.insert(0, 'cluster_category', segment[result['cluster'].cat.codes.to_numpy()])
+        result.insert(0, 'cluster', result.pop('cluster'))
+        result = sc.append_score(result, edges = edges)
+        self.segmentation = sg.Segmentation.from_model(fitmodel, modelrfm.scaling, cluster_center,
+                                                       metadata = dict(self.set_params, engine = self.engine))
+        starttime = self.__stage('category', starttime)
+
+        # 7. Export
+        if(parameter.get('output')):
+            export_data(result, parameter.get('output'))
+        if(parameter.get('modelpath')):
+            self.segmentation.save(parameter.get('modelpath'))
+        self.__stage('export', starttime)
+
+        self.timings['customers'] = len(result)
+        return result
+
+    def __run_grouped(self, datasource : da.DataSource, starttime : float, **parameter) -> pd.DataFrame:
+        # 1-2. Load and clean, 3. group index and R-F-M per group
+        data = da.clean_data(datasource.read_data())
+        starttime = self.__stage('load', starttime)
+        
+        groups = gp.split_groups(GroupIndex(data, attributes = [self.groupby]), self.groupby)
+        del data
+        starttime = self.__stage('aggregate', starttime)
+        
+        # 4-6. Scale, cluster and category per group in the process pool
+        set_params = {key : value for key, value in self.set_params.items() if key not in ['chunksize', 'scaledpath', 'n_restarts']}
+        result, self.categories = gp.grouped_modelling(groups, self.engine, set_params,
+                                                       workers = self.workers or os.cpu_count() or 1)
+        starttime = self.__stage('cluster', starttime)
+        
+        # 7. Export
+        if(parameter.get('output')):
+            export_data(result, parameter.get('output'))
+        self.__stage('export', starttime)
+        
+        self.timings.update(groups = len(groups), customers = len(result))
+        return result
+
+def main(argv : list = None):
+    parser = argparse.ArgumentParser(description = 'Headless RFM and K-Means customer segmentation')
+    parser.add_argument('--source', action = 'append', help = 'URL, path or glob of a transaction csv (repeatable)')
+    parser.add_argument('--output', default = 'Customer Segmentation.parquet', help = '.parquet, .arrow or .csv[.gz] result file')
+    parser.add_argument('--model', help = 'Optional path of the segmentation artifact (.npz)')
+    parser.add_argument('--scaler', default = 'Standard Scaler')
+    parser.add_argument('--n-clusters', type = int, default = 5)
+    parser.add_argument('--iterations', type = int, default = 300)
+    parser.add_argument('--engine', default = 'kmeans')
+    parser.add_argument('--restarts', type = int, default = 1, help = 'Seeded restarts in parallel, the best by inertia is kept')
+    parser.add_argument('--stream', action = 'store_true', help = 'Aggregate chunk by chunk instead of in memory')
+    parser.add_argument('--chunksize', type = int, default = 1_000_000)
+    parser.add_argument('--cachedir', help = 'Directory of the local source cache')
+    parser.add_argument('--dtype', choices = ['float64', 'float32'], default = 'float64', help = 'Precision of the feature matrix')
+    parser.add_argument('--compare', action = 'store_true', help = 'With --dtype float32, also fit float64 and report memory and label changes')
+    parser.add_argument('--group-by', choices = ['province', 'city', 'brand'], help = 'One segmentation per value of this attribute')
+    parser.add_argument('--workers', type = int, help = 'Processes for --group-by, default every core')
+    parser.add_argument('--scaled', help = 'Path of a float32 .npy memmap for the scaled matrix (out of core scaling)')
+    parser.add_argument('--profile', help = 'Directory of per-stage cProfile dumps, also logs stage records')
+    args = parser.parse_args(argv)
+    if(args.group_by and args.restarts > 1):
+        parser.error('--restarts is not supported with --group-by, the groups already run in parallel')
+    
+    if(args.profile):
+        logging.basicConfig(level = logging.INFO, format = '%(message)s')
+        PROFILER.enable(profiledir = args.profile)
+
+    pipeline = Pipeline(listsource = args.source,
+                        cachedir = args.cachedir,
+                        stream = args.stream,
+                        chunksize = args.chunksize,
+                        scalertype = args.scaler,
+                        n_clusters = args.n_clusters,
+                        iteration = args.iterations,
+                        engine = args.engine,
+                        scaledpath = args.scaled,
+                        dtype = args.dtype,
+                        compare = args.compare,
+                        n_restarts = args.restarts,
+                        groupby = args.group_by,
+                        workers = args.workers)
+    pipeline.run(output = args.output, modelpath = args.model)
+
+    # Stage timings as one JSON line for the job log
+    print(json.dumps(pipeline.timings), file = sys.stderr)
+    if(args.compare and args.dtype != 'float64'):
+        print(json.dumps(pipeline.precision), file = sys.stderr)
+    if(getattr(pipeline, 'stability', None) is not None):
+        print(json.dumps(dict(best_seed = pipeline.stability['best_seed'],
+                              mean_adjusted_rand = pipeline.stability['mean_adjusted_rand'],
+                              clusters = pipeline.stability['clusters'].to_dict(orient = 'records'))), file = sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+"""
+Created on Sat Oct 17 16:02:19 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+def histogram_bins(values, bins = 50) -> pd.DataFrame:
+    # Binned on the server, the chart only receives one row per bin
+    values = np.asarray(values, dtype = 'float64')
+    values = values[np.isfinite(values)]
+    count, edges = np.histogram(values, bins = bins)
+
+    return pd.DataFrame(dict(left = edges[:-1],
+                             right = edges[1:],
+                             center = (edges[:-1] + edges[1:]) / 2,
+                             width = np.diff(edges),
+                             count = count))
+
+def box_statistics(values, max_outliers : int = 500, random_state : int = 42) -> dict:
+    # Tukey box (1.5 IQR fences) with a capped sample of the outliers
+    values = np.asarray(values, dtype = 'float64')
+    values = values[np.isfinite(values)]
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+
+    isinside = (values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)
+    outliers = values[~isinside]
+    if(len(outliers) > max_outliers):
+        random   = np.random.default_rng(random_state)
+        outliers = np.concatenate([[outliers.min(), outliers.max()],
+                                   random.choice(outliers, max_outliers - 2, replace = False)])
+
+    return dict(q1 = q1,
+                median = median,
+                q3 = q3,
+                mean = values.mean(),
+                lowerfence = values[isinside].min(),
+                upperfence = values[isinside].max(),
+                outliers = outliers,
+                n_outliers = int((~isinside).sum()))
+
+def stratified_sample(data : pd.DataFrame, by : str = 'cluster', budget : int = 5000,
+                      min_per_group : int = 50, random_state : int = 42) -> pd.DataFrame:
+    # About budget rows, every group keeps its share (and at least min_per_group rows)
+    if(len(data) <= budget):
+        return data
+
+    column = data[by]
+    if(isinstance(column.dtype, pd.CategoricalDtype)):
+        codes = column.cat.codes.to_numpy()
+    else:
+        codes = pd.factorize(column, sort = True)[0]
+    size  = np.bincount(codes)
+    quota = np.minimum(size, np.maximum(np.ceil(budget * size / len(data)), min_per_group)).astype('int64')
+
+    # Random order, then keep the first quota rows of every group
+    random = np.random.default_rng(random_state)
+    order  = random.permutation(len(data))
+    rank   = pd.Series(codes[order]).groupby(codes[order]).cumcount().to_numpy()
+    keep   = np.sort(order[rank < quota[codes[order]]])
+    return data.iloc[keep]
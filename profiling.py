@@ -0,0 +1,269 @@
+import gc
+import os
+import sys
+import json
+import ctypes
+import time
+import logging
+import cProfile
+import threading
+import tracemalloc
+import pandas as pd
+from collections import deque
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+"""
+Created on Sat Oct 17 17:58:10 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+PAGESIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss() -> int:
+    # Resident memory of this process in bytes, 0 when it cannot be read
+    try:
+        with open('/proc/self/statm', 'rb') as file:
+            return int(file.read().split()[1]) * PAGESIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if(psutil is not None):
+        return psutil.Process().memory_info().rss
+    return 0
+
+def max_rss() -> int:
+    # Peak resident memory since the process started (ru_maxrss is KB on Linux, bytes on macOS)
+    if(resource is None):
+        return 0
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return value if sys.platform == 'darwin' else value * 1024
+
+class RSSPeak():
+
+    def __init__(self, interval : float = 0.005):
+        # Peak resident memory of every open measurement, so Arrow and other native buffers
+        # count too. A daemon thread samples RSS every interval seconds while one is open, a new
+        # process peak (ru_maxrss) reached during a measurement is taken as is.
+        self.interval = interval
+        self.lock     = threading.Lock()
+        self.open     = {}
+        self.counter  = 0
+        self.thread   = None
+
+    def start(self) -> int:
+        rss = current_rss()
+        with self.lock:
+            self.counter += 1
+            self.open[self.counter] = [rss, rss, max_rss()]
+            if(self.thread is None):
+                self.thread = threading.Thread(target = self.__sample, name = 'rss-sampler', daemon = True)
+                self.thread.start()
+            return self.counter
+
+    def stop(self, token : int) -> tuple:
+        # Peak and starting resident memory in bytes
+        rss, maxrss = current_rss(), max_rss()
+        with self.lock:
+            start, peak, startmax = self.open.pop(token)
+        if(maxrss > startmax):
+            peak = max(peak, maxrss)
+        return max(peak, rss), start
+
+    def __sample(self):
+        while(True):
+            rss = current_rss()
+            with self.lock:
+                if(not self.open):
+                    self.thread = None
+                    return
+                for entry in self.open.values():
+                    entry[1] = max(entry[1], rss)
+            time.sleep(self.interval)
+
+class TracedPeak():
+
+    def __init__(self):
+        # Peak tracemalloc memory of every open measurement. Tracing starts with the first one
+        # (unless something else already traces) and stops with the last one if it was started
+        # here. A new measurement resets the tracemalloc peak, the open ones keep the peak so far.
+        self.lock    = threading.Lock()
+        self.open    = {}
+        self.counter = 0
+        self.started = False
+
+    def start(self) -> int:
+        with self.lock:
+            if(not tracemalloc.is_tracing()):
+                tracemalloc.start()
+                self.started = True
+            peak = tracemalloc.get_traced_memory()[1]
+            for entry in self.open.values():
+                entry[1] = max(entry[1], peak)
+            tracemalloc.reset_peak()
+
+            current = tracemalloc.get_traced_memory()[0]
+            self.counter += 1
+            self.open[self.counter] = [current, current]
+            return self.counter
+
+    def stop(self, token : int) -> tuple:
+        # Peak and starting traced memory in bytes
+        with self.lock:
+            start, peak = self.open.pop(token)
+            if(tracemalloc.is_tracing()):
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if(not self.open and self.started):
+                tracemalloc.stop()
+                self.started = False
+        return peak, start
+
+def release_memory():
+    # Collect garbage and hand freed heap pages back to the OS (glibc), so a following RSS
+    # measurement is not hidden by memory the allocator kept from earlier work
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+# Process-wide peak memory measurements, shared by the profiler, benchmark and precision report
+RSSPEAK    = RSSPeak()
+TRACEDPEAK = TracedPeak()
+MEMORY     = {'rss' : RSSPEAK, 'traced' : TRACEDPEAK}
+
+class NullStage():
+    # Returned while profiling is disabled, entering it costs one method call
+
+    def __enter__(self) -> dict:
+        return {}
+
+    def __exit__(self, *exception):
+        return False
+
+NULLSTAGE = NullStage()
+
+class Stage():
+
+    def __init__(self, profiler, name : str, fields : dict):
+        self.profiler = profiler
+        self.record   = dict(stage = name, **fields)
+
+    def __enter__(self) -> dict:
+        self.profile  = self.profiler.start_profile()
+        self.memory   = self.profiler.start_memory()
+        self.walltime = time.perf_counter()
+        self.cputime  = time.thread_time()
+        return self.record
+
+    def __exit__(self, *exception):
+        walltime = time.perf_counter() - self.walltime
+        cputime  = time.thread_time() - self.cputime
+        self.record.update(wall_time = round(walltime, 4),
+                           cpu_time = round(cputime, 4),
+                           thread = threading.current_thread().name)
+        if(self.memory is not None):
+            self.record.update(self.profiler.stop_memory(self.memory))
+        if(self.profile is not None):
+            self.record['profile'] = self.profiler.stop_profile(self.profile, self.record['stage'])
+        if(exception[0] is not None):
+            self.record['error'] = exception[0].__name__
+        self.profiler.add(self.record)
+        return False
+
+class Profiler():
+
+    def __init__(self, **parameter):
+        # Enabled with RFM_PROFILE=1, cProfile dump per stage (.prof, for pstats / snakeviz)
+        # when RFM_PROFILEDIR is set. Disabled stages record nothing. Peak memory is RSS by
+        # default, RFM_PROFILE_MEMORY=traced uses tracemalloc (slows the stages down several
+        # times and misses native buffers) and none records no memory. The last max_records
+        # records are kept.
+        self.enabled    = parameter.get('enabled', os.environ.get('RFM_PROFILE', '0') not in ('', '0'))
+        self.memory     = parameter.get('memory', os.environ.get('RFM_PROFILE_MEMORY', 'rss'))
+        self.profiledir = parameter.get('profiledir', os.environ.get('RFM_PROFILEDIR'))
+        self.logger     = logging.getLogger(parameter.get('logger', 'rfm_analysis.profile'))
+        self.records    = deque(maxlen = parameter.get('max_records', 1000))
+        self.count      = 0
+        self.lock       = threading.Lock()
+        self.local      = threading.local()
+
+    def enable(self, **parameter):
+        self.enabled    = True
+        self.memory     = parameter.get('memory', self.memory)
+        self.profiledir = parameter.get('profiledir', self.profiledir)
+
+    def disable(self):
+        self.enabled = False
+
+    def stage(self, name : str, **fields):
+        # with PROFILER.stage('cluster') as record: ... record['n_iter'] = ...
+        if(not self.enabled):
+            return NULLSTAGE
+        return Stage(self, name, fields)
+
+    def start_memory(self) -> tuple:
+        # Open measurement as (tracker, token), None when memory is not recorded
+        tracker = MEMORY.get(self.memory) if isinstance(self.memory, str) else None
+        if(tracker is None):
+            return None
+        return tracker, tracker.start()
+
+    def stop_memory(self, memory : tuple) -> dict:
+        # Peak above the stage start and peak of the whole process (RSS) or of all traced memory
+        tracker, token = memory
+        peak, start = tracker.stop(token)
+        return dict(peak_memory_mb = round((peak - start) / 1024 ** 2, 2),
+                    peak_total_mb = round(peak / 1024 ** 2, 2))
+
+    def start_profile(self):
+        # One cProfile per thread, a nested stage is part of its outer stage profile
+        if(self.profiledir is None or getattr(self.local, 'profiling', False)):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. py-spy is fine, but sys.setprofile users are not) is active
+            return None
+        self.local.profiling = True
+        return profile
+
+    def stop_profile(self, profile, name : str) -> str:
+        profile.disable()
+        self.local.profiling = False
+        os.makedirs(self.profiledir, exist_ok = True)
+        filename = os.path.join(self.profiledir, '{}-{}-{}.prof'.format(name, os.getpid(), time.time_ns()))
+        profile.dump_stats(filename)
+        return filename
+
+    def add(self, record : dict):
+        with self.lock:
+            self.records.append(record)
+            self.count += 1
+        self.logger.info(json.dumps(record, default = str))
+
+    def mark(self) -> int:
+        # Position to pass to summary(since = ...) for the records of one run
+        return self.count
+
+    def summary(self, since : int = 0) -> pd.DataFrame:
+        # Records added since the mark and still kept
+        with self.lock:
+            records = list(self.records)[max(since - (self.count - len(self.records)), 0):]
+        return pd.DataFrame(records)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+# Process-wide profiler used by every instrumented stage
+PROFILER = Profiler()
@@ -1,43 +1,48 @@
+import time
+STARTTIME = time.perf_counter()
+
+import json
+import logging
+import importlib
 import streamlit as st
 import pandas as pd
-import numpy as np
-import datetime as dt
 import data_and_attributes as da
 import modelling as model
-import plotly.express as px
-import plotly.graph_objects as go
+import segmentation as sg
+import plotting as pt
+import descriptive as ds
+import grouping as gp
+import export as ex
+from profiling import PROFILER
+from jobs import FITJOBS
+from concurrent.futures import ThreadPoolExecutor
+from aggregation import get_aggregation
+import scoring as sc
+from scoring import cluster_category
+from pipeline import modelling
 
 st.set_page_config(layout = "wide")
 
-def get_aggregation(data : pd.DataFrame) -> pd.DataFrame:
-    aggregate = data.groupby(by = ['customer_id'], as_index = False).agg(lastpurchasedate = ('order_date' , pd.Series.max),
-                                                                         frequency = ('order_id', pd.Series.nunique),
-                                                                         monetary = ('total_price', pd.Series.sum))
-    
-    aggregate['recency'] = (data['order_date'].max() + dt.timedelta(1) - aggregate['lastpurchasedate']).dt.days
-    aggregate = aggregate[['customer_id', 'lastpurchasedate', 'recency', 'frequency', 'monetary']]
-    return(aggregate)
+# Maximum number of customer plotted on the 3D scatter
+POINTBUDGET = 5000
+
+# Cold start timings (seconds since the script started), logged once the page is complete
+TIMINGS = dict(importtime = round(time.perf_counter() - STARTTIME, 4))
+
+def load_plotly():
+    # Plotly is imported on the first chart instead of at start up
+    import plotly.express as px
+    import plotly.graph_objects as go
+    return px, go
+
+def show_profile(since : int):
+    # Stage records of this run (RFM_PROFILE=1), also logged on 'rfm_analysis.profile'
+    spacer1, row_1, spacer2 = st.columns((0.1, 7.2, 0.1))
+    with row_1:
+        with st.expander('Profiling'):
+            st.dataframe(PROFILER.summary(since = since))
+            st.json(TIMINGS)
 
-def modelling(data : pd.DataFrame, **set_params) -> pd.DataFrame:
-    standarization = set_params.get('standarization', True)
-    scalertype = set_params.get('scalertype', 'standartscaler')
-    n_clusters = set_params.get('n_clusters', 5)
-    iteration  = set_params.get('iteration', 300)
-    
-    parameters = dict(standarization = standarization,
-                      scalertype = scalertype,
-                      n_clusters = n_clusters,
-                      iterations = iteration)
-    
-    fitmodel = model.Modelling(data = data[['recency', 'frequency', 'monetary']])\
-                    .clustering(clustertype = 'kmeans',
-                                set_params = parameters)
-          
-    data['cluster'] = np.array(map(str, fitmodel.labels_))
-    data = data.sort_values(by = ['cluster', 'customer_id'],
-                            ignore_index = True)
-    return fitmodel, data
-    
 def header():
     teks = []
     
@@ -114,6 +119,17 @@ def show_data(data : pd.DataFrame):
         
         st.text("\n Deskripsi Kolom\n" + kolomdesc)
 
+def select_filter(datasource : da.DataSource) -> dict:
+    # Optional subset, answered from the group index without rescanning the transactions
+    spacer1, row_1, spacer2, row_2, spacer3, row_3, spacer4 = st.columns((0.1, 2.3, 0.1, 2.3, 0.1, 2.3, 0.1))
+    filters = {}
+    for row, (attribute, label) in zip([row_1, row_2, row_3], [('province', 'Provinsi'), ('city', 'Kota'), ('brand', 'Brand')]):
+        with row:
+            values = st.multiselect('Filter ' + label, datasource.get_attribute(attribute))
+        if(values):
+            filters[attribute] = values
+    return filters
+
 def show_aggregation(data : pd.DataFrame):
     spacer1, row3_1, spacer2 = st.columns((0.1, 7.2, 0.1))
     with row3_1:
@@ -133,29 +149,50 @@ def show_aggregation(data : pd.DataFrame):
     with row3_3: 
         st.dataframe(data)        
 
-def overview(data : pd.DataFrame, indicator : str, histcolor : str):
+def overview(data : pd.DataFrame, indicator : str, histcolor : str, stats : pd.DataFrame = None):
+    px, go = load_plotly()
     
     indicator = indicator.lower()
+    if(stats is None):
+        stats = ds.describe(data[[indicator]]).summary()
     
     spacer1, row4, spacer2 = st.columns((0.1, 7.2, 0.1))
     with row4: 
         st.subheader("Indikator " + indicator.capitalize())
         
     spacer1, row4_1, spacer2, row4_2, spacer3, row4_3, spacer4, row4_4, spacer5, row4_5, spacer6 = st.columns((0.7, 2, 0.1, 2, 0.1, 2, 0.1, 2, 0.1, 2, 0.4))
-    row4_1.metric("Rataan", round(data[indicator].mean(), 2))
-    row4_2.metric("Simpangan Baku", round(data[indicator].std(),2))
-    row4_3.metric("Minimum", round(data[indicator].min(),2))
-    row4_4.metric("Maksimum", round(data[indicator].max(),2))
-    row4_5.metric("Modus", round(data[indicator].mode(),2))
-    
-    fig1 = px.histogram(data, x = indicator.lower(),
-                       color_discrete_sequence=[histcolor],
-                       title = 'Histogram ' + indicator.capitalize()) 
-
-    fig2 = go.Figure(data=[go.Box(x = data[indicator], 
-                                  boxpoints = 'outliers',
+    row4_1.metric("Rataan", round(stats.loc[indicator, 'mean'], 2))
+    row4_2.metric("Simpangan Baku", round(stats.loc[indicator, 'std'], 2))
+    row4_3.metric("Minimum", round(stats.loc[indicator, 'min'], 2))
+    row4_4.metric("Maksimum", round(stats.loc[indicator, 'max'], 2))
+    row4_5.metric("Modus", round(stats.loc[indicator, 'mode'], 2))
+    
+    # Histogram and boxplot are computed here, only bins and box statistics are sent to the browser
+    histogram = pt.histogram_bins(data[indicator], bins = 50)
+    fig1 = px.bar(histogram, x = 'center', y = 'count',
+                  color_discrete_sequence=[histcolor],
+                  title = 'Histogram ' + indicator.capitalize(),
+                  labels = dict(center = indicator, count = 'count'))
+    fig1.update_traces(width = histogram['width'], marker_line_width = 0)
+    
+    boxstat = pt.box_statistics(data[indicator], max_outliers = 500)
+    fig2 = go.Figure(data=[go.Box(q1 = [boxstat['q1']],
+                                  median = [boxstat['median']],
+                                  q3 = [boxstat['q3']],
+                                  mean = [boxstat['mean']],
+                                  lowerfence = [boxstat['lowerfence']],
+                                  upperfence = [boxstat['upperfence']],
+                                  y = [indicator],
+                                  orientation = 'h',
+                                  boxpoints = False,
                                   marker_color = histcolor,
-                                  name = indicator)]
+                                  name = indicator),
+                           go.Scatter(x = boxstat['outliers'],
+                                      y = [indicator] * len(boxstat['outliers']),
+                                      mode = 'markers',
+                                      marker_color = histcolor,
+                                      showlegend = False,
+                                      name = 'outliers')]
                     )
 
     fig2.update_yaxes(visible = False)
@@ -166,9 +203,13 @@ def overview(data : pd.DataFrame, indicator : str, histcolor : str):
         st.plotly_chart(fig1, use_container_width = True)
         st.plotly_chart(fig2, use_container_width = True)
     
-def show_dataoverview(data : pd.DataFrame):
+def show_dataoverview(data : pd.DataFrame, datasetkey : tuple):
+    px, go = load_plotly()
     
-    korelasi = data.corr(method ='pearson')
+    # Moments, extrema, mode and correlation of every indicator in one cached pass
+    statistics = ds.describe(data[['recency', 'frequency', 'monetary']], key = datasetkey)
+    korelasi   = statistics.correlation()
+    summary    = statistics.summary()
     fig = px.imshow(korelasi,
                     title = 'Korelasi R-F-M',
                     text_auto = True,
@@ -209,41 +250,113 @@ def show_dataoverview(data : pd.DataFrame):
                                          default = list(colormap.keys()))
         
     for indicator in selectindicator:
-        overview(data, indicator, histcolor = colormap[indicator])
+        overview(data, indicator, histcolor = colormap[indicator], stats = summary)
 
-def cluster_category(centroid : pd.DataFrame):
-    
-    centroid['R'] = centroid['R'].max() - centroid['R'] + 1
-    
-    #Scoring
-    for i in ['R', 'F', 'M']:
-        centroid[i + '_Score'] = pd.qcut(centroid[i], 5, labels = range(1, 6))
-    
-    conditions = [
-            (centroid['R_Score'].between(4, 5)) & (centroid['F_Score'].between(4, 5)) & (centroid['M_Score'].between(4, 5)),
-            (centroid['R_Score'].between(2, 4)) & (centroid['F_Score'].between(3, 4)) & (centroid['M_Score'].between(4, 5)),
-            (centroid['R_Score'].between(3, 5)) & (centroid['F_Score'].between(1, 3)) & (centroid['M_Score'].between(1, 3)),
-            (centroid['R_Score'].between(4, 5)) & (centroid['F_Score'] < 2) & (centroid['M_Score'] < 2),
-            (centroid['R_Score'].between(3, 4)) & (centroid['F_Score'] < 2) & (centroid['M_Score'] < 2),
-            (centroid['R_Score'].between(3, 4)) & (centroid['F_Score'].between(3, 4)) & (centroid['M_Score'].between(3, 4)),
-            (centroid['R_Score'].between(2, 3)) & (centroid['F_Score'] < 3) & (centroid['M_Score'] < 3),
-            (centroid['R_Score'] < 3) & (centroid['F_Score'].between(2, 5)) & (centroid['M_Score'].between(2, 5)),
-            (centroid['R_Score'] < 2) & (centroid['F_Score'].between(4, 5)) & (centroid['M_Score'].between(4, 5)),
-            (centroid['R_Score'].between(2, 3)) & (centroid['F_Score'].between(2, 3)) & (centroid['M_Score'].between(2, 3))
-        ]
-    choices = ['Champions', 'Loyal Customers', 'Potential Loyalists', 'New Customers',
-               'Promising', 'Need Attention', 'About to Sleep', 'At Risk',
-               'Cant Lose Them', 'Hibernating']
-    
-    centroid['cluster_category'] = np.select(conditions, choices, default = 'Lost')
-    centroid['cluster'] = list(map(lambda ls: 'Cluster ' + str(ls), centroid.index + 1))
-    return centroid
+def show_sweep(data : pd.DataFrame, scalertype : str, datasetkey : tuple):
+    px, go = load_plotly()
+    sweep = model.Modelling(data = data[['recency', 'frequency', 'monetary']], fingerprint = ('rfm',) + datasetkey)\
+                 .sweep(krange = range(2, 16),
+                        scalertype = scalertype,
+                        sample_size = 5000)
+    
+    fig1 = px.line(sweep, x = 'n_clusters', y = 'inertia',
+                   title = 'Elbow Method (Inertia)',
+                   markers = True)
+    
+    fig2 = px.line(sweep, x = 'n_clusters', y = ['silhouette', 'davies_bouldin'],
+                   title = 'Silhouette & Davies-Bouldin Score',
+                   markers = True)
+    
+    spacer1, row_1, spacer2, row_2, spacer3 = st.columns((0.1, 4, 0.1, 4, 0.1))
+    with row_1:
+        st.plotly_chart(fig1, use_container_width = True)
+    with row_2:
+        st.plotly_chart(fig2, use_container_width = True)
 
-@st.cache
-def convert_df(df):
-    return df.to_csv().encode('utf-8')
-        
-def show_modelling(data : pd.DataFrame):
+# Download format label and file extension
+EXPORTFORMATS = {'CSV (gzip)' : '.csv.gz',
+                 'Parquet'    : '.parquet',
+                 'Arrow IPC'  : '.arrow',
+                 'CSV'        : '.csv'}
+
+def show_download(data : pd.DataFrame, fitkey : tuple):
+    # Exported once per fit (fit job key : dataset fingerprint, filters and parameters) and
+    # format, written to disk in chunks
+    formatlabel = st.selectbox('Format download', list(EXPORTFORMATS))
+    extension   = EXPORTFORMATS[formatlabel]
+    exportkey   = ('segmentation',) + fitkey
+    
+    with st.spinner('Menyiapkan file ...'):
+        path = ex.cached_export(exportkey, data, extension)
+    
+    with open(path, 'rb') as file:
+        st.download_button(label = 'Download data as ' + formatlabel,
+                           data = file,
+                           file_name = 'Customer Segmentation' + extension,
+                           mime = ex.FORMATS[extension])
+        
+def wait_fit(job, placeholder, label : str = 'Iterasi'):
+    # Progress of the running fit, a widget change interrupts this loop and reruns the page
+    while(not job.done()):
+        with placeholder.container():
+            st.progress(job.fraction())
+            st.caption((label + ' {iteration}, inertia {inertia}').format(**job.progress))
+        time.sleep(0.25)
+    placeholder.empty()
+
+def segment_fit(fitmodel, result : pd.DataFrame, scaling : dict) -> tuple:
+    # Centroid scores / categories and the scored customers of one fit, built from the fit's own
+    # customers only, so the exported frame always matches the fit key it is cached under
+    edges = sc.get_edges(result)
+    cluster_center = cluster_category(pd.DataFrame(fitmodel.cluster_centers_, columns = ['R', 'F', 'M']),
+                                      edges = edges,
+                                      rawcentroid = sc.unscale(fitmodel.cluster_centers_, scaling))
+    
+    # Category per customer looked up by cluster code, result is already sorted by cluster
+    segment   = cluster_center['cluster_category'].to_numpy()
+    segmented = result.copy(deep = False)
+    segmented.insert(0, 'cluster_category', segment[segmented['cluster'].cat.codes.to_numpy()])
+    segmented.insert(0, 'cluster', segmented.pop('cluster'))
+    return cluster_center, sc.append_score(segmented, edges = edges)
+
+def fit_segment(data : pd.DataFrame, params : dict, key : tuple, callback) -> tuple:
+    fitmodel, result, scaling = modelling(data, callback = callback, **params)
+    return (fitmodel, result, scaling, params, key) + segment_fit(fitmodel, result, scaling)
+
+def fit_background(data : pd.DataFrame, datasetkey : tuple, params : dict) -> tuple:
+    # The fit runs in FITJOBS, a parameter change cancels the stale job of this session and
+    # the last finished fit stays on screen until the new one is ready. datasetkey identifies
+    # data (dataset fingerprint and filters), so the frame is not hashed on every rerun.
+    key = datasetkey + (tuple(sorted(params.items())),)
+    job = FITJOBS.submit(st.session_state.get('fitjob'), key,
+                         lambda job: fit_segment(data, params, key, job.report),
+                         total = params['n_restarts'] if params['n_restarts'] > 1 else params['iteration'])
+    st.session_state['fitjob'] = job
+    
+    # With restarts the progress is counted in finished restarts
+    if(not job.done() and st.session_state.get('lastfit') is None):
+        wait_fit(job, st.empty(), label = 'Restart' if params['n_restarts'] > 1 else 'Iterasi')
+    
+    if(job.done() and not job.failed()):
+        st.session_state['lastfit'] = job.result()
+    elif(job.done() and not job.future.cancelled()):
+        st.error('Model gagal dibuat : {}'.format(job.future.exception()))
+    elif(not job.done()):
+        st.info('Model dengan parameter baru sedang dibuat, hasil sebelumnya ditampilkan')
+    
+    if(st.session_state.get('lastfit') is None):
+        st.stop()
+    return st.session_state['lastfit']
+
+def refresh_when_fitted():
+    # Page shows a previous fit while the current one runs, rerun once it is ready
+    job = st.session_state.get('fitjob')
+    if(job is not None and not job.done()):
+        wait_fit(job, st.empty())
+        st.experimental_rerun()
+
+def show_modelling(data : pd.DataFrame, datasetkey : tuple):
+    px, go = load_plotly()
     spacer1, row4_1, spacer2 = st.columns((0.1, 7.2, 0.1))
     with row4_1:
         st.subheader('4. K-Means Clustering')
@@ -275,22 +388,34 @@ def show_modelling(data : pd.DataFrame):
         
         iteration = st.slider('Maksimum Iterasi', 1, 1000, 300)
         
+        n_restart = st.number_input('Banyak Restart (uji stabilitas)',
+                                    min_value = 1,
+                                    max_value = 16,
+                                    value = 1)
+        
+        engine = st.selectbox('Algoritma K-Means', ('K-Means',
+                                                    'Elkan',
+                                                    'Mini-Batch K-Means',
+                                                    'NumPy K-Means'))
+        
         scaler = st.radio("Pilih Metode Scaler", ('Standard Scaler',
                                                   'Min-Max Scaler',
                                                   'Maximum Absolute Scaler',
                                                   'Robust Scaler'))
         
-        fit_rfm, result_rfm = modelling(data, 
-                                        standarization = True,
-                                        scalertype = scaler,
-                                        n_clusters = n_cluster,
-                                        iteration = iteration)
+        fit_rfm, result_rfm, scaling, params, fitkey, cluster_center, segmented = fit_background(data, datasetkey, dict(standarization = True,
+                                                                                             scalertype = scaler,
+                                                                                             n_clusters = n_cluster,
+                                                                                             iteration = iteration,
+                                                                                             n_restarts = n_restart,
+                                                                                             engine = engine))
     
+    # Parameters of the fit on screen, they differ from the inputs while a new fit runs
+    scaler, n_cluster, iteration, engine = params['scalertype'], params['n_clusters'], params['iteration'], params['engine']
     plotcolor = px.colors.qualitative.Light24[0:n_cluster]
     
-    result_rfm['cluster'] = result_rfm['cluster'].apply(lambda x: 'Cluster ' + str(int(x) + 1))
-        
-    fig1 = px.scatter_3d(result_rfm,
+    # Stratified sample per cluster keeps the 3D scatter payload bounded
+    fig1 = px.scatter_3d(pt.stratified_sample(result_rfm, by = 'cluster', budget = POINTBUDGET),
                          x = 'recency', 
                          y = 'frequency', 
                          z = 'monetary',
@@ -302,7 +427,9 @@ def show_modelling(data : pd.DataFrame):
     with row4_3:
         st.plotly_chart(fig1, use_container_width = True)
             
-    labels = result_rfm.groupby('cluster', as_index = False).agg(total_customer = ('cluster', pd.Series.count))
+    totalcustomer = result_rfm['cluster'].value_counts(sort = False)
+    labels = pd.DataFrame(dict(cluster = totalcustomer.index.astype(str),
+                               total_customer = totalcustomer.to_numpy()))
 
     fig3 = go.Figure(data=[go.Pie(labels = labels['cluster'],
                                   values = labels['total_customer'],
@@ -316,6 +443,18 @@ def show_modelling(data : pd.DataFrame):
     
     with row4_4:
         st.plotly_chart(fig3, use_container_width = True)
+    
+    spacer1, row4_4a, spacer2 = st.columns((0.1, 7.2, 0.1))
+    with row4_4a:
+        if(st.checkbox('Tampilkan grafik Elbow dan Silhouette untuk memilih banyak cluster')):
+            show_sweep(data, scalertype = scaler, datasetkey = datasetkey)
+        
+        # Agreement of the seeded restarts, best restart by inertia is the model shown
+        stability = getattr(fit_rfm, 'stability_', None)
+        if(stability is not None):
+            st.markdown('Stabilitas {} restart (seed terbaik : {}, rata-rata Adjusted Rand Index : {:.3f})'
+                        .format(len(stability['runs']), stability['best_seed'], stability['mean_adjusted_rand']))
+            st.dataframe(stability['clusters'])
 
     
     spacer1, row4_5, spacer2 = st.columns((0.1, 7.2, 0.1))
@@ -331,12 +470,15 @@ def show_modelling(data : pd.DataFrame):
         teks1 = da.Formater(text = teks1).text_markdown(align = 'justify')
         st.markdown('\n{}'.format(teks1), unsafe_allow_html = True) 
     
-    cluster_center = pd.DataFrame(fit_rfm.cluster_centers_,
-                                  columns = ['R', 'F', 'M'])
-
-    cluster_center = cluster_category(cluster_center)
+    # Centroids scored in the fit job against the quintile edges of the customers of this fit
+    # (while a new fit runs the previous one is shown, data already belongs to the new one)
     cluster_center = cluster_center.merge(labels, on = ['cluster'], how = 'inner')
     cluster_center['color'] = plotcolor
+    segmentation = sg.Segmentation.from_model(fit_rfm, scaling, cluster_center,
+                                              metadata = dict(scalertype = scaler,
+                                                              engine = engine,
+                                                              n_clusters = n_cluster,
+                                                              iteration = iteration))
     
     cluster_center_transpose = cluster_center[['R', 'F' ,'M']].T
     cluster_center_transpose.rename(columns = lambda x: 'Cluster ' + str(int(x) + 1), inplace=True)
@@ -426,21 +568,50 @@ def show_modelling(data : pd.DataFrame):
                  caption = 'R-F-M Strategy (Sumber : https://bit.ly/3z42IN1)',
                  width = 500)
     with row4_15:   
-        result_rfm = cluster_center[['cluster', 'cluster_category']].merge(result_rfm,
-                                                                           on = ['cluster'], 
-                                                                           how = 'inner')
-        result_rfm = result_rfm.sort_values(by = ['cluster'], ignore_index = True)
-        st.dataframe(result_rfm, height = 500)
+        st.dataframe(segmented, height = 500)
         
         st.markdown('')
         
+        show_download(segmented, fitkey)
+        
         st.download_button(
-            label = "Download data as CSV",
-            data = convert_df(result_rfm),
-            file_name = 'Customer Segmentation.csv',
-            mime = 'text/csv',
+            label = "Download model segmentasi",
+            data = segmentation.to_bytes(),
+            file_name = 'Customer Segmentation Model.npz',
+            mime = 'application/octet-stream',
         )
         
+    return dict(standarization = True,
+                scalertype = scaler,
+                n_clusters = n_cluster,
+                iterations = iteration,
+                engine = engine)
+
+def show_grouped(datasource : da.DataSource, filters : dict, params : dict):
+    spacer1, row_1, spacer2 = st.columns((0.1, 7.2, 0.1))
+    with row_1:
+        if(not st.checkbox('Tampilkan segmentasi terpisah per provinsi, kota atau brand')):
+            return
+        
+        attribute = st.selectbox('Segmentasi per', ('province', 'city', 'brand'))
+        set_params = {key : value for key, value in params.items() if key != 'engine'}
+        groupkey = ('grouped', attribute, tuple(sorted((key, tuple(value)) for key, value in filters.items())),
+                    tuple(sorted(params.items()))) + datasource.datakey
+        
+        # One model per group fitted in parallel processes, shared by every session
+        with st.spinner('Membuat model per ' + attribute + ' ...'):
+            result, categories = gp.GROUPCACHE.get_or_compute(groupkey, lambda: gp.grouped_modelling(
+                gp.split_groups(datasource.get_groupindex(), attribute, **filters),
+                params['engine'], set_params))
+        
+        if(not categories):
+            st.warning('Tidak ada transaksi untuk filter yang dipilih')
+            return
+        
+        st.dataframe(pd.concat(categories.values(), ignore_index = True)[['group', 'cluster', 'R_Score', 'F_Score', 'M_Score', 'cluster_category']])
+        st.dataframe(result, height = 500)
+
+def show_conclusion():
     spacer1, row4_16, spacer2 = st.columns((0.1, 7.2, 0.1))
     with row4_16:
         st.subheader('6. Kesimpulan')
@@ -459,25 +630,56 @@ def show_modelling(data : pd.DataFrame):
         
 if __name__ == "__main__":
     
+    # Data, scikit-learn and plotly are loaded in the background while the header renders
+    profilemark = PROFILER.mark()
+    background = ThreadPoolExecutor(max_workers = 2)
+    datasource = da.DataSource()
+    datafuture = background.submit(datasource.get_data)
+    for module in ['plotly.express', 'sklearn.cluster']:
+        background.submit(importlib.import_module, module)
+    
     header()
+    TIMINGS['firstpaint'] = round(time.perf_counter() - STARTTIME, 4)
     
     # Get data
-    datasource = da.DataSource()
-    dataclean  = datasource.get_data()
+    with st.spinner('Memuat data ...'):
+        dataclean = datafuture.result()
     
-    show_data(dataclean)
-    
-    #filter on the column that is used only
+    #filter on the column that is used only, aggregation runs while the data table renders
     data = dataclean[['order_id', 'customer_id', 'order_date', 'total_price']]
+    aggregationfuture = background.submit(get_aggregation, data)
+    
+    with PROFILER.stage('render_data', rows = len(dataclean)):
+        show_data(dataclean)
+    TIMINGS['data'] = round(time.perf_counter() - STARTTIME, 4)
     
-    rfm_per_cust = get_aggregation(data)
-    show_aggregation(rfm_per_cust)
+    filters = select_filter(datasource)
+    if(filters):
+        rfm_per_cust = datasource.get_groupindex().get_aggregation(**filters)
+        if(rfm_per_cust.empty):
+            st.warning('Tidak ada transaksi untuk filter yang dipilih')
+            st.stop()
+    else:
+        rfm_per_cust = aggregationfuture.result()
     
-    show_dataoverview(rfm_per_cust)
+    # Source files and filters identify rfm_per_cust, so caches below never hash the frame
+    datasetkey = (datasource.get_fingerprint(), tuple(sorted((key, tuple(value)) for key, value in filters.items())))
+    
+    with PROFILER.stage('render_overview', rows = len(rfm_per_cust)):
+        show_aggregation(rfm_per_cust)
+        show_dataoverview(rfm_per_cust, datasetkey)
     
     # Modelling process 
-    show_modelling(rfm_per_cust)
+    with PROFILER.stage('render_modelling', rows = len(rfm_per_cust)):
+        params = show_modelling(rfm_per_cust, datasetkey)
+        show_grouped(datasource, filters, params)
+        show_conclusion()
+    TIMINGS['complete'] = round(time.perf_counter() - STARTTIME, 4)
     
-
+    if(PROFILER.enabled):
+        show_profile(since = profilemark)
     
-
+    background.shutdown(wait = False)
+    logging.getLogger('rfm_analysis').info(json.dumps(TIMINGS))
+    
+    refresh_when_fitted()
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+"""
+Created on Sat Oct 17 15:03:52 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+# Segment rules as (name, R range, F range, M range) on 1-5 scores, inclusive.
+# The first matching rule wins, score triple without any match is DEFAULTSEGMENT.
+SEGMENTRULES = [('Champions',           (4, 5), (4, 5), (4, 5)),
+                ('Loyal Customers',     (2, 4), (3, 4), (4, 5)),
+                ('Potential Loyalists', (3, 5), (1, 3), (1, 3)),
+                ('New Customers',       (4, 5), (1, 1), (1, 1)),
+                ('Promising',           (3, 4), (1, 1), (1, 1)),
+                ('Need Attention',      (3, 4), (3, 4), (3, 4)),
+                ('About to Sleep',      (2, 3), (1, 2), (1, 2)),
+                ('At Risk',             (1, 2), (2, 5), (2, 5)),
+                ('Cant Lose Them',      (1, 1), (4, 5), (4, 5)),
+                ('Hibernating',         (2, 3), (2, 3), (2, 3))]
+
+DEFAULTSEGMENT = 'Lost'
+
+def segment_table(rules : list = SEGMENTRULES, default : str = DEFAULTSEGMENT) -> tuple:
+    # 5 x 5 x 5 lookup of segment code by (R, F, M) score - 1
+    names = [rule[0] for rule in rules] + [default]
+    table = np.full((5, 5, 5), len(rules), dtype = 'int8')
+    score = np.arange(1, 6)
+
+    for code in reversed(range(len(rules))):
+        name, rrange, frange, mrange = rules[code]
+        match = ((score >= rrange[0]) & (score <= rrange[1]))[:, None, None] \
+              & ((score >= frange[0]) & (score <= frange[1]))[None, :, None] \
+              & ((score >= mrange[0]) & (score <= mrange[1]))[None, None, :]
+        table[match] = code
+
+    return table, names
+
+def quantile_edges(values, n_score : int = 5) -> np.ndarray:
+    # Inner edges between the n_score quantile bins. Tied values can put several quantiles on
+    # the same edge (e.g. most customers buying once), those bins are collapsed into one as
+    # pd.qcut(duplicates = 'drop') does, leaving fewer than n_score scores.
+    return np.unique(np.quantile(np.asarray(values, dtype = 'float64'), np.arange(1, n_score) / n_score))
+
+def get_score(values, edges : np.ndarray, reverse : bool = False) -> np.ndarray:
+    # 1 for the lowest bin up to len(edges) + 1, reverse when a lower value is better (recency).
+    # Bins are right-closed like pd.qcut, a value equal to an edge is in the lower bin; reversed,
+    # it is in the lower bin of the reversed value (max - value), i.e. the higher score.
+    values = np.asarray(values, dtype = 'float64')
+    if(reverse):
+        return (len(edges) + 1 - np.searchsorted(edges, values, side = 'right')).astype('int8')
+    return (np.searchsorted(edges, values, side = 'left') + 1).astype('int8')
+
+def get_edges(data : pd.DataFrame) -> dict:
+    return dict(R = quantile_edges(data['recency']),
+                F = quantile_edges(data['frequency']),
+                M = quantile_edges(data['monetary']))
+
+def score_segment(recency, frequency, monetary, **parameter) -> pd.DataFrame:
+    edges = parameter.get('edges')
+    table, names = parameter.get('table') or segment_table(parameter.get('rules', SEGMENTRULES),
+                                                           parameter.get('default', DEFAULTSEGMENT))
+
+    rscore = get_score(recency, edges['R'], reverse = True)
+    fscore = get_score(frequency, edges['F'])
+    mscore = get_score(monetary, edges['M'])
+
+    return pd.DataFrame(dict(R_Score = rscore,
+                             F_Score = fscore,
+                             M_Score = mscore,
+                             segment = pd.Categorical.from_codes(table[rscore - 1, fscore - 1, mscore - 1],
+                                                                 categories = names)))
+
+def score_customers(data : pd.DataFrame, edges : dict = None, **parameter) -> pd.DataFrame:
+    # Quintile score of every customer, edges default to the quantiles of data itself
+    parameter['edges'] = edges or get_edges(data)
+    return score_segment(data['recency'], data['frequency'], data['monetary'], **parameter)
+
+def append_score(data : pd.DataFrame, edges : dict = None, **parameter) -> pd.DataFrame:
+    # Customer frame with its own R-F-M scores and rule based segment (rfm_segment)
+    scored = score_customers(data, edges = edges, **parameter).rename(columns = dict(segment = 'rfm_segment'))
+    scored.index = data.index
+    return pd.concat([data, scored], axis = 1)
+
+def unscale(centers : np.ndarray, scaling : dict) -> np.ndarray:
+    # Centroid back in the original R-F-M units
+    return np.asarray(centers) * scaling['scale'] + scaling['center']
+
+def cluster_category(centroid : pd.DataFrame, **parameter) -> pd.DataFrame:
+    # Centroid scored against customer quantile edges (edges) using its position in the
+    # original R-F-M units (rawcentroid). Without edges the centroids are scored among themselves.
+    rawcentroid = parameter.get('rawcentroid', centroid[['R', 'F', 'M']].to_numpy())
+    parameter['edges'] = parameter.get('edges') or dict(R = quantile_edges(rawcentroid[:, 0]),
+                                                        F = quantile_edges(rawcentroid[:, 1]),
+                                                        M = quantile_edges(rawcentroid[:, 2]))
+
+    scored = score_segment(rawcentroid[:, 0], rawcentroid[:, 1], rawcentroid[:, 2], **parameter)
+
+    centroid['R'] = centroid['R'].max() - centroid['R'] + 1
+
+    #Scoring
+    for i in ['R', 'F', 'M']:
+        centroid[i + '_Score'] = scored[i + '_Score'].to_numpy()
+
+    centroid['cluster_category'] = scored['segment'].astype(str).to_numpy()
+    centroid['cluster'] = list(map(lambda ls: 'Cluster ' + str(ls), centroid.index + 1))
+    return centroid
@@ -0,0 +1,81 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+
+"""
+Created on Sat Oct 17 14:20:37 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+class Segmentation():
+
+    def __init__(self, **parameter):
+        # Everything needed to label new customers : affine scaler, centroids (scaled space)
+        # and the cluster name / cluster_category of every centroid
+        self.features  = list(parameter.get('features', ['recency', 'frequency', 'monetary']))
+        self.center    = np.asarray(parameter.get('center'), dtype = 'float64')
+        self.scale     = np.asarray(parameter.get('scale'), dtype = 'float64')
+        self.centroids = np.asarray(parameter.get('centroids'), dtype = 'float64')
+        self.clusters  = list(parameter.get('clusters', ['Cluster ' + str(index + 1) for index in range(len(self.centroids))]))
+        self.segments  = list(parameter.get('segments', self.clusters))
+        self.metadata  = dict(parameter.get('metadata', {}))
+
+        self.__centernorm = (self.centroids ** 2).sum(axis = 1)
+
+    @classmethod
+    def from_model(cls, fitmodel, scaling : dict, cluster_center : pd.DataFrame, **parameter):
+        # cluster_center is the cluster_category output, one row per centroid in label order
+        return cls(center = scaling['center'],
+                   scale = scaling['scale'],
+                   centroids = fitmodel.cluster_centers_,
+                   clusters = cluster_center['cluster'].tolist(),
+                   segments = cluster_center['cluster_category'].tolist(),
+                   features = parameter.get('features', ['recency', 'frequency', 'monetary']),
+                   metadata = parameter.get('metadata', {}))
+
+    def save(self, file):
+        # file is a path or a binary buffer
+        np.savez(file,
+                 center = self.center,
+                 scale = self.scale,
+                 centroids = self.centroids,
+                 header = np.array(json.dumps(dict(features = self.features,
+                                                   clusters = self.clusters,
+                                                   segments = self.segments,
+                                                   metadata = self.metadata))))
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        self.save(buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as saved:
+            header = json.loads(str(saved['header']))
+            return cls(center = saved['center'],
+                       scale = saved['scale'],
+                       centroids = saved['centroids'],
+                       **header)
+
+    def predict(self, data, chunksize : int = 1_000_000) -> np.ndarray:
+        # Nearest centroid, the distance matrix only exists for one chunk at a time
+        if(isinstance(data, pd.DataFrame)):
+            data = data[self.features].to_numpy(dtype = 'float64')
+
+        labels = np.empty(len(data), dtype = 'int64')
+        for start in range(0, len(data), chunksize):
+            chunk = (np.asarray(data[start:start + chunksize], dtype = 'float64') - self.center) / self.scale
+            distance = self.__centernorm - 2 * chunk @ self.centroids.T
+            labels[start:start + len(chunk)] = distance.argmin(axis = 1)
+        return labels
+
+    def predict_frame(self, data : pd.DataFrame, chunksize : int = 1_000_000) -> pd.DataFrame:
+        labels = self.predict(data, chunksize = chunksize)
+
+        result = data.copy()
+        result.insert(0, 'cluster_category', np.asarray(self.segments, dtype = 'object')[labels])
+        result.insert(0, 'cluster', pd.Categorical.from_codes(labels, categories = self.clusters, ordered = True))
+        return result
@@ -0,0 +1,144 @@
+import os
+import io
+import json
+import hashlib
+import urllib.error
+import urllib.request
+import pandas as pd
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+"""
+Created on Sat Oct 17 09:12:31 2026
+
+@author: Bachtiyar M. Arief
+"""
+
+class SourceCache():
+
+    def __init__(self, **parameter):
+        defaultdir = os.path.join(os.path.expanduser('~'), '.cache', 'rfm_kmeans')
+
+        self.cachedir    = parameter.get('cachedir') or os.environ.get('RFM_CACHEDIR', defaultdir)
+        self.columntype  = parameter.get('columntype', {})
+        self.parse_dates = parameter.get('parse_dates', ['order_date'])
+        self.timeout     = parameter.get('timeout', 10)
+
+        # Without pyarrow there is no columnar format to write, every read goes to the source
+        self.enabled = feather is not None
+        if(self.enabled):
+            os.makedirs(self.cachedir, exist_ok = True)
+
+    def __path(self, source : str, extension : str) -> str:
+        key = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        return os.path.join(self.cachedir, key + extension)
+
+    def __schema(self) -> str:
+        # Cached file is typed, so it is only valid for the same dtype and date parsing
+        schema = json.dumps(dict(columntype = self.columntype, parse_dates = self.parse_dates), sort_keys = True)
+        return hashlib.sha1(schema.encode('utf-8')).hexdigest()
+
+    def __validator(self, source : str) -> dict:
+        # Local file is validated by size and mtime, remote file by its HTTP headers.
+        # None means the source cannot be reached right now, an empty validator that the
+        # server answered without usable headers (e.g. 405 for HEAD) : the content is compared.
+        if(os.path.exists(source)):
+            stat = os.stat(source)
+            return dict(size = stat.st_size, mtime = stat.st_mtime_ns)
+
+        try:
+            request = urllib.request.Request(source, method = 'HEAD')
+            with urllib.request.urlopen(request, timeout = self.timeout) as response:
+                headers = response.headers
+        except urllib.error.HTTPError:
+            return {}
+        except (OSError, ValueError):
+            return None
+
+        validator = dict(etag = headers.get('ETag'),
+                         size = headers.get('Content-Length'),
+                         mtime = headers.get('Last-Modified'))
+        return {key : value for key, value in validator.items() if value is not None}
+
+    def __fetch(self, source : str) -> bytes:
+        if(os.path.exists(source)):
+            with open(source, 'rb') as file:
+                return file.read()
+
+        with urllib.request.urlopen(source, timeout = self.timeout) as response:
+            return response.read()
+
+    def __parse(self, content : bytes) -> pd.DataFrame:
+        return pd.read_csv(io.BytesIO(content),
+                           dtype = self.columntype,
+                           parse_dates = self.parse_dates)
+
+    def __read_meta(self, source : str) -> dict:
+        try:
+            with open(self.__path(source, '.json'), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def __write_meta(self, source : str, meta : dict):
+        path = self.__path(source, '.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump(meta, file)
+        os.replace(path + '.tmp', path)
+
+    def __load(self, source : str) -> pd.DataFrame:
+        # Uncompressed feather is read through a memory map instead of a full file read
+        table = feather.read_table(self.__path(source, '.feather'), memory_map = True)
+        return table.to_pandas()
+
+    def __store(self, source : str, data : pd.DataFrame):
+        path = self.__path(source, '.feather')
+        feather.write_feather(data, path + '.tmp', compression = 'uncompressed')
+        os.replace(path + '.tmp', path)
+
+    def read(self, source : str) -> pd.DataFrame:
+        if(not self.enabled):
+            return self.__parse(self.__fetch(source))
+
+        meta      = self.__read_meta(source)
+        schema    = self.__schema()
+        validator = self.__validator(source)
+        iscached  = meta.get('schema') == schema and os.path.exists(self.__path(source, '.feather'))
+
+        # 1. Source unchanged (or unreachable) : serve the columnar copy
+        if(iscached and (validator is None or (validator and validator == meta.get('validator')))):
+            return self.__load(source)
+
+        # 2. Source metadata changed (or not available) but the content did not : skip parsing.
+        # A failed download still falls back to the cached copy.
+        try:
+            content = self.__fetch(source)
+        except (OSError, ValueError):
+            if(iscached):
+                return self.__load(source)
+            raise
+        digest = hashlib.sha256(content).hexdigest()
+
+        if(iscached and digest == meta.get('sha256')):
+            self.__write_meta(source, dict(meta, validator = validator))
+            return self.__load(source)
+
+        # 3. New content : parse once and store it typed
+        data = self.__parse(content)
+        self.__store(source, data)
+        self.__write_meta(source, dict(source = source,
+                                       schema = schema,
+                                       sha256 = digest,
+                                       validator = validator))
+        return data
+
+    def clear(self):
+        if(not self.enabled):
+            return
+
+        for filename in os.listdir(self.cachedir):
+            if(filename.endswith(('.feather', '.json', '.tmp'))):
+                os.remove(os.path.join(self.cachedir, filename))